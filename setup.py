@@ -46,6 +46,7 @@ setup(
     package_dir={"": "src"},
     install_requires=[
         "closure-problem>=2020.5.1",  # Uses https://github.com/hochbaumGroup/pseudoflow-parametric-cut
+        "pseudoflow>=2020.5.1,<2023",  # HncArrayProblem calls its C library directly
         "networkx",
         "numpy",
         "pillow",
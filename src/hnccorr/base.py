@@ -24,22 +24,28 @@
 """Base components of HNCcorr."""
 
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
 
 from hnccorr.movie import Patch
 from hnccorr.graph import (
     CorrelationEmbedding,
-    exponential_distance_decay,
+    ExponentialDistanceDecay,
     GraphConstructor,
+    IncrementalCorrelationEmbedding,
     SparseComputationEmbeddingWrapper,
+    select_uncorrelated_pixels,
 )
 from hnccorr.seeds import (
     PositiveSeedSelector,
     NegativeSeedSelector,
     LocalCorrelationSeeder,
 )
-from hnccorr.segmentation import HncParametricWrapper
+from hnccorr.cache import PatchCache
+from hnccorr.segmentation import HncParametricWrapper, clean_segmentations
 from hnccorr.postprocessor import SizePostprocessor
+from hnccorr.utils import fixed_random_state
 
 
 class Candidate:
@@ -50,7 +56,9 @@ class Candidate:
             selected by the postprocessor.
         center_seed (tuple): Seed pixel coordinates.
         clean_segmentations (list[Segmentation]): List of segmentation after calling
-            `clean()` on each segmentation.
+            `clean()` on each segmentation. If the postprocessor provides
+            ``is_size_feasible()``, segmentations that cannot reach a feasible size
+            are not cleaned and omitted. See :func:`~.clean_segmentations`.
         segmentations (list[Segmentation]): List of segmentations returned by HNC.
         _hnccorr (HNCcorr): HNCcorr object.
     """
@@ -81,26 +89,71 @@ class Candidate:
         clustering problem for all values of the trade-off parameter lambda. The
         postprocessor selects the best segmentation or determines that no cell is found.
 
+        If HNCcorr has a correlation threshold, pixels whose correlation to the
+        positive seeds is below the threshold are added to the negative seeds. These
+        pixels keep their edges, such that the HNC objective is unchanged, but they are
+        contracted into the sink and are never part of a segmentation.
+
+        If HNCcorr has a patch cache, the patch, embedding and graph of an earlier
+        candidate with the same patch are reused.
+
+        The global random number generator of numpy is seeded with the coordinate
+        offset of the patch while the graph is constructed. The graph therefore does
+        not depend on the candidates evaluated before, even with the randomized
+        default dimension reducer of sparse computation.
+
         Returns:
             Segmentation or None: Best segmentation or None if no cell is found.
         """
         movie = self._hnccorr.movie
         pos_seeds = self._hnccorr.positive_seed_selector.select(self.center_seed, movie)
         neg_seeds = self._hnccorr.negative_seed_selector.select(self.center_seed, movie)
-        patch = self._hnccorr.patch_class(
-            movie, self.center_seed, self._hnccorr.patch_size
-        )
-        embedding = self._hnccorr.embedding_class(patch)
-        graph = self._hnccorr.graph_constructor.construct(patch, embedding)
+        patch, embedding, graph = self._construct_graph()
+        threshold = self._hnccorr.correlation_threshold
+        if threshold is not None:
+            neg_seeds = neg_seeds | select_uncorrelated_pixels(
+                patch, embedding, pos_seeds, threshold
+            )
         self.segmentations = self._hnccorr.segmentor.solve(graph, pos_seeds, neg_seeds)
-        self.clean_segmentations = [
-            s.clean(pos_seeds, movie.pixel_shape) for s in self.segmentations
-        ]
-        self.best_segmentation = self._hnccorr.postprocessor.select(
-            self.clean_segmentations
+        postprocessor = self._hnccorr.postprocessor
+        self.clean_segmentations = clean_segmentations(
+            self.segmentations,
+            pos_seeds,
+            movie.pixel_shape,
+            getattr(postprocessor, "is_size_feasible", None),
         )
+        self.best_segmentation = postprocessor.select(self.clean_segmentations)
         return self.best_segmentation
 
+    def _construct_graph(self):
+        """Constructs the similarity graph of the candidate's patch.
+
+        See :meth:`segment` for the use of the patch cache.
+
+        Returns:
+            tuple: Patch, embedding and similarity graph of the candidate.
+        """
+        cache = self._hnccorr.patch_cache
+        if cache is not None:
+            coordinate_offset = self._hnccorr.patch_class.compute_coordinate_offset(
+                self.center_seed,
+                self._hnccorr.patch_size,
+                self._hnccorr.movie.pixel_shape,
+            )
+            entry = cache.get(coordinate_offset)
+            if entry is not None:
+                return entry
+
+        patch = self._hnccorr.patch_class(
+            self._hnccorr.movie, self.center_seed, self._hnccorr.patch_size
+        )
+        embedding = self._hnccorr.embedding_class(patch)
+        with fixed_random_state(list(patch.coordinate_offset)):
+            graph = self._hnccorr.graph_constructor.construct(patch, embedding)
+        if cache is not None:
+            cache.put(patch, embedding, graph)
+        return patch, embedding, graph
+
 
 class HNCcorr:
     """Implementation of the HNCcorr algorithm.
@@ -109,6 +162,14 @@ class HNCcorr:
     segmenting the movie. How each candidate seed / location is evaluated is specified
     in the Candidate class.
 
+    The optional `correlation_threshold` adds the pixels that are not correlated to the
+    positive seeds of a candidate to its negative seeds, see
+    :func:`~.select_uncorrelated_pixels`. No pixels are added if None.
+
+    The optional `patch_cache` reuses the patch, embedding and graph of candidates with
+    the same patch, see :class:`~.PatchCache`. The cache is cleared when a movie is
+    segmented.
+
     References:
         Q Spaen, R Asín-Achá, SN Chettih, M Minderer, C Harvey, and DS Hochbaum (2019).
         HNCcorr: A Novel Combinatorial Approach for Cell Identification in
@@ -129,6 +190,8 @@ class HNCcorr:
         patch_class,
         embedding_class,
         patch_size,
+        correlation_threshold=None,
+        patch_cache=None,
     ):
         """Initalizes HNCcorr object."""
         self.seeder = seeder
@@ -141,6 +204,10 @@ class HNCcorr:
         self.patch_class = patch_class
         self.embedding_class = embedding_class
         self.patch_size = patch_size
+        self.correlation_threshold = correlation_threshold
+        self.patch_cache = patch_cache
+
+        self.config = None
 
         self.movie = None
         self.segmentations = []
@@ -154,6 +221,10 @@ class HNCcorr:
         Default components are used, and parameters are taken from the input
         configuration or inferred from the default configuration if not specified.
 
+        The combined configuration is stored in the `config` attribute. All default
+        components are picklable, and the components can be rebuilt elsewhere, e.g. in
+        a worker process, with ``HNCcorr.from_config(hnccorr.config)``.
+
         Args:
             config (HNCcorrConfig): HNCcorrConfig object with modified configuration.
                 Parameters that are not explicitly specified in the `config` object are
@@ -172,12 +243,13 @@ class HNCcorr:
             config.sparse_computation_dimension, config.sparse_computation_grid_distance
         )
 
-        return cls(
+        hnccorr = cls(
             LocalCorrelationSeeder(
                 config.seeder_mask_size,
                 config.percentage_of_seeds,
                 config.seeder_exclusion_padding,
                 config.seeder_grid_size,
+                cache_dir=config.seeder_cache_dir,
             ),
             SizePostprocessor(
                 config.postprocessor_min_cell_size,
@@ -191,17 +263,23 @@ class HNCcorr:
             ),
             GraphConstructor(
                 edge_selector,
-                lambda a, b: exponential_distance_decay(
-                    a, b, config.gaussian_similarity_alpha
-                ),
+                ExponentialDistanceDecay(config.gaussian_similarity_alpha),
             ),
             Candidate,
             Patch,
-            CorrelationEmbedding,
+            IncrementalCorrelationEmbedding()
+            if config.incremental_correlation_embedding
+            else CorrelationEmbedding,
             config.patch_size,
+            config.negative_seed_correlation_threshold,
+            PatchCache(config.patch_cache_size * 2 ** 20)
+            if config.patch_cache_size
+            else None,
         )
+        hnccorr.config = config
+        return hnccorr
 
-    def segment(self, movie):
+    def segment(self, movie, num_workers=None):
         """Applies the HNCcorr algorithm to identify cells in a calcium-imaging movie.
 
         Identifies cells the spatial footprints of cells in a calcium imaging movie.
@@ -211,18 +289,58 @@ class HNCcorr:
         than once. Although segmented pixels cannot seed a new segmentation, they may
         be segmented again.
 
+        If `num_workers` is larger than one, upcoming seeds are evaluated
+        speculatively in a pool of worker processes. The results are committed in the
+        order of the seeder, and a result is discarded if its seed is excluded by a
+        cell committed before it. The identified cells are therefore the same as for a
+        serial run, provided that the components only use the global random number
+        generator of numpy during graph construction, see :meth:`Candidate.segment`.
+        The workers receive a copy of the HNCcorr object, which must be picklable on
+        platforms that do not fork processes. A movie in shared memory, see
+        :meth:`~.Movie.to_shared`, is not copied to the workers. An
+        :class:`~.IncrementalCorrelationEmbedding` depends on the candidates
+        evaluated before in the same process and is not supported with workers.
+
         Identified cells are accessible through the `segmentations` attribute.
 
+        Args:
+            movie (Movie): Calcium imaging movie.
+            num_workers (int or None): Number of worker processes. Candidates are
+                evaluated in the main process if None or 1.
+
         Returns:
             Reference to itself.
+
+        Raises:
+            ValueError: If `num_workers` is larger than one and the embedding class
+                is an :class:`~.IncrementalCorrelationEmbedding`.
         """
+        parallel = num_workers is not None and num_workers > 1
+        incremental = isinstance(self.embedding_class, IncrementalCorrelationEmbedding)
+        if parallel and incremental:
+            raise ValueError(
+                "An incremental correlation embedding is not supported with workers."
+            )
+
         self.movie = movie
         self.seeder.reset()
         self.segmentations = []
         self.candidates = []
+        if self.patch_cache is not None:
+            self.patch_cache.clear()
 
         self.seeder.select_seeds(movie)
 
+        if parallel:
+            self._segment_parallel(num_workers)
+        else:
+            self._segment_serial()
+
+        print("Completed - Total cells identified: %d" % len(self.segmentations))
+        return self
+
+    def _segment_serial(self):
+        """Evaluates the candidates one at a time in the main process."""
         seed = self.seeder.next()
         while seed is not None:
             candidate = self._candidate_class(seed, self)
@@ -231,14 +349,47 @@ class HNCcorr:
                 "Cells identified: %d, Next candidate: %d"
                 % (len(self.segmentations), len(self.candidates))
             )
-            best_segmentation = candidate.segment()
-            if best_segmentation is not None:
-                self.segmentations.append(best_segmentation)
-                self.seeder.exclude_pixels(best_segmentation.selection)
+            self._commit(candidate.segment())
             seed = self.seeder.next()
 
-        print("Completed - Total cells identified: %d" % len(self.segmentations))
-        return self
+    def _segment_parallel(self, num_workers):
+        """Evaluates the candidates speculatively in a pool of worker processes.
+
+        Up to two candidates per worker are in flight. Results are committed in the
+        order in which the seeder provided the seeds. Seeds that are excluded when
+        their result is committed would not have been evaluated in a serial run, and
+        their results are discarded.
+        """
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_initialize_worker,
+            initargs=(self,),
+        ) as executor:
+            pending = deque()
+            seed = self.seeder.next()
+            while seed is not None or pending:
+                while seed is not None and len(pending) < 2 * num_workers:
+                    pending.append((seed, executor.submit(_segment_candidate, seed)))
+                    seed = self.seeder.next()
+
+                center_seed, future = pending.popleft()
+                candidate = future.result()
+                if self.seeder.is_excluded(center_seed):
+                    continue
+
+                candidate._hnccorr = self  # pylint: disable=W0212
+                self.candidates.append(candidate)
+                print(
+                    "Cells identified: %d, Next candidate: %d"
+                    % (len(self.segmentations), len(self.candidates))
+                )
+                self._commit(candidate.best_segmentation)
+
+    def _commit(self, best_segmentation):
+        """Stores a segmented cell and excludes its pixels as seeds."""
+        if best_segmentation is not None:
+            self.segmentations.append(best_segmentation)
+            self.seeder.exclude_pixels(best_segmentation.selection)
 
     def segmentations_to_list(self):
         """Exports segmentations to a list of dictionaries.
@@ -258,6 +409,31 @@ class HNCcorr:
         return output
 
 
+# HNCcorr object of a worker process. See HNCcorr.segment().
+_WORKER_HNCCORR = None
+
+
+def _initialize_worker(hnccorr):
+    """Stores the HNCcorr object in a worker process."""
+    global _WORKER_HNCCORR  # pylint: disable=W0603
+    _WORKER_HNCCORR = hnccorr
+
+
+def _segment_candidate(center_seed):
+    """Segments a candidate in a worker process.
+
+    Returns:
+        Candidate: Segmented candidate. Its reference to the HNCcorr object is removed,
+        such that the HNCcorr object and its movie are not sent back to the main
+        process. The main process reattaches its HNCcorr object.
+    """
+    # pylint: disable=W0212
+    candidate = _WORKER_HNCCORR._candidate_class(center_seed, _WORKER_HNCCORR)
+    candidate.segment()
+    candidate._hnccorr = None
+    return candidate
+
+
 class HNCcorrConfig:
     """Configuration class for HNCcorr algorithm.
 
@@ -273,6 +449,8 @@ class HNCcorrConfig:
             surrounding segmented cells.
         seeder_grid_size (int): Size of grid bloc per dimension. Seeder maintains only
             the best candidate pixel for each grid block.
+        seeder_cache_dir (str or None): Directory where the seeder caches the local
+            correlation of each pixel. Caching is disabled when None.
         percentage_of_seeds (float[0, 1]): Fraction of candidate seeds to evaluate.
         postprocessor_min_cell_size (int): Lower bound on pixel count of a cell.
         postprocessor_max_cell_size (int): Upper bound on pixel count of a cell.
@@ -281,12 +459,21 @@ class HNCcorrConfig:
         negative_seed_circle_radius (int): Radius in pixels of the circle with negative
             seeds.
         negative_seed_circle_count (int): Number of negative seeds.
+        negative_seed_correlation_threshold (float or None): Pixels with a lower
+            average correlation to the positive seeds are added to the negative seeds.
+            No pixels are added when None.
         gaussian_similarity_alpha (alpha): Decay factor in gaussian similarity function.
         sparse_computation_grid_distance (float): 1 / grid_resolution. Width of each
             block in sparse computation.
         sparse_computation_dimension (int): Dimension of the low-dimensional space in
             sparse computation.
         patch_size (int): Size in pixel of each dimension of the patch.
+        incremental_correlation_embedding (bool): If True, the correlation embedding
+            of a patch reuses the correlations of the previous patch where the patches
+            overlap. Not supported when segmenting with multiple workers.
+        patch_cache_size (float): Memory limit in megabytes of the cache with the
+            patch, embedding and graph of recent candidates. Caching is disabled when
+            zero.
         _entries (dict): Dict with parameter keys and values. Each parameter value
             (when defined) is also accessible as an attribute.
     """
@@ -298,6 +485,7 @@ class HNCcorrConfig:
             "seeder_mask_size",
             "seeder_exclusion_padding",
             "seeder_grid_size",
+            "seeder_cache_dir",
             "percentage_of_seeds",
             "postprocessor_min_cell_size",
             "postprocessor_max_cell_size",
@@ -309,6 +497,9 @@ class HNCcorrConfig:
             "sparse_computation_grid_distance",
             "sparse_computation_dimension",
             "patch_size",
+            "negative_seed_correlation_threshold",
+            "patch_cache_size",
+            "incremental_correlation_embedding",
         }
 
         for param in entries:
@@ -348,6 +539,7 @@ DEFAULT_CONFIG = HNCcorrConfig(
     seeder_mask_size=3,
     seeder_exclusion_padding=4,
     seeder_grid_size=5,
+    seeder_cache_dir=None,
     percentage_of_seeds=0.40,
     postprocessor_min_cell_size=40,
     postprocessor_max_cell_size=200,
@@ -355,8 +547,11 @@ DEFAULT_CONFIG = HNCcorrConfig(
     positive_seed_radius=0,
     negative_seed_circle_radius=10,
     negative_seed_circle_count=10,
+    negative_seed_correlation_threshold=None,
     gaussian_similarity_alpha=1.0,
     sparse_computation_grid_distance=1 / 35.0,
     sparse_computation_dimension=3,
     patch_size=31,
+    patch_cache_size=0,
+    incremental_correlation_embedding=False,
 )
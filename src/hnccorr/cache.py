@@ -0,0 +1,136 @@
+# Copyright © 2017. Regents of the University of California (Regents). All Rights
+# Reserved.
+#
+# Permission to use, copy, modify, and distribute this software and its documentation
+# for educational, research, and not-for-profit purposes, without fee and without a
+# signed licensing agreement, is hereby granted, provided that the above copyright
+# notice, this paragraph and the following two paragraphs appear in all copies,
+# modifications, and distributions. Contact The Office of Technology Licensing, UC
+# Berkeley, 2150 Shattuck Avenue, Suite 510, Berkeley, CA 94720-1620, (510) 643-7201,
+# for commercial licensing opportunities. Created by Quico Spaen, Roberto Asín-Achá,
+# and Dorit S. Hochbaum, Department of Industrial Engineering and Operations Research,
+# University of California, Berkeley.
+#
+# IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+# INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF THE USE
+# OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+# SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED "AS
+# IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+# ENHANCEMENTS, OR MODIFICATIONS.
+"""Cache for the patches of candidates in HNCcorr."""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PatchCache:
+    """Least recently used cache for the patch, embedding and graph of a candidate.
+
+    Patches are shifted to stay within the movie boundaries, so candidates near the
+    boundary often share the same patch. The patch data, the embedding and the
+    similarity graph depend only on the patch and are reused for these candidates.
+    Entries are identified by the coordinate offset of the patch.
+
+    The memory of an entry is estimated by the size of the arrays of the patch, the
+    embedding and the graph. The patch data is a copy of the movie data and is
+    counted. The least recently used entries are evicted when the memory exceeds
+    `max_bytes`.
+
+    The cache is pickled without its entries.
+
+    Attributes:
+        hits (int): Number of lookups that found an entry.
+        misses (int): Number of lookups that did not find an entry.
+        _entries (OrderedDict): Maps the coordinate offset of a patch to a tuple with
+            the patch, the embedding, the graph and the memory of the entry.
+            Ordered from least to most recently used.
+        _max_bytes (int): Upper bound on the memory of all entries.
+        _num_bytes (int): Memory of all entries.
+    """
+
+    def __init__(self, max_bytes):
+        """Initializes a PatchCache object."""
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Number of entries in the cache."""
+        return len(self._entries)
+
+    @property
+    def num_bytes(self):
+        """int: Memory of all entries."""
+        return self._num_bytes
+
+    def get(self, coordinate_offset):
+        """Looks up the entry of a patch.
+
+        Args:
+            coordinate_offset (tuple): Movie coordinates of the top left pixel of the
+                patch.
+
+        Returns:
+            tuple or None: Patch, embedding and graph of the patch. None if the patch
+            is not in the cache.
+        """
+        key = tuple(coordinate_offset)
+        if key not in self._entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][:3]
+
+    def put(self, patch, embedding, graph):
+        """Adds the entry of a patch to the cache.
+
+        Least recently used entries are evicted to stay within the memory limit. An
+        entry that exceeds the memory limit by itself is not added.
+
+        Args:
+            patch (Patch): Patch of a candidate.
+            embedding (CorrelationEmbedding): Embedding of the patch.
+            graph (SimilarityGraph): Similarity graph of the patch.
+        """
+        key = tuple(patch.coordinate_offset)
+        if key in self._entries:
+            self._num_bytes -= self._entries.pop(key)[3]
+
+        num_bytes = self._nbytes(patch) + self._nbytes(embedding) + self._nbytes(graph)
+        if num_bytes > self._max_bytes:
+            return
+
+        while self._entries and self._num_bytes + num_bytes > self._max_bytes:
+            self._num_bytes -= self._entries.popitem(last=False)[1][3]
+
+        self._entries[key] = (patch, embedding, graph, num_bytes)
+        self._num_bytes += num_bytes
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        self._entries.clear()
+        self._num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        """Returns the state of the cache without entries."""
+        state = self.__dict__.copy()
+        state["_entries"] = OrderedDict()
+        state["_num_bytes"] = 0
+        return state
+
+    @staticmethod
+    def _nbytes(obj):
+        """Computes the memory of the array attributes of an object."""
+        attributes = getattr(obj, "__dict__", {}).values()
+        return sum(x.nbytes for x in attributes if isinstance(x, np.ndarray))
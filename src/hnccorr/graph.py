@@ -23,12 +23,76 @@
 # ENHANCEMENTS, OR MODIFICATIONS.
 """HNCcorr components related to the similarity graph."""
 
-import networkx as nx
+import weakref
+
 import numpy as np
 from sparsecomputation import SparseComputation as SC
 from sparsecomputation import ApproximatePCA
 
-from hnccorr.utils import add_time_index
+from hnccorr.utils import add_offset_set_coordinates, add_time_index
+
+
+def normalize_pixels(data, dtype=np.float32):
+    """Normalizes the time series of each pixel to zero mean and unit norm.
+
+    The correlation between two pixels is the inner product of their normalized time
+    series. Pixels with a constant time series have an undefined correlation. Their
+    normalized time series is set to zero, such that their correlation to any pixel is
+    zero.
+
+    Args:
+        data (np.array): (T, P) array with the time series of P pixels.
+        dtype (np.dtype): Data type of the normalized time series.
+
+    Returns:
+        np.array: (T, P) array with the normalized time series.
+    """
+    centered = data - np.mean(data, axis=0, keepdims=True)
+    norm = np.sqrt(np.sum(centered ** 2, axis=0))
+
+    constant = np.ptp(data, axis=0) == 0
+    scale = np.zeros(norm.shape)
+    scale[~constant] = 1.0 / norm[~constant]
+
+    return (centered * scale).astype(dtype)
+
+
+def select_uncorrelated_pixels(patch, embedding, pixels, threshold):
+    """Selects the pixels in a patch that are not correlated to a set of pixels.
+
+    The correlation of a pixel to the set is its average correlation to the pixels in
+    the set. Correlations are computed from the normalized time series of the
+    embedding. The pixels in the set are never selected.
+
+    Args:
+        patch (Patch): Patch of the embedding.
+        embedding (CorrelationEmbedding): Embedding with the normalized time series of
+            the pixels in the patch.
+        pixels (set): Movie coordinates of the pixels. Pixels outside of the patch are
+            ignored.
+        threshold (float): Pixels with a lower correlation to the set are selected.
+
+    Returns:
+        set: Movie coordinates of the selected pixels. No pixels are selected if no
+        pixel of the set is inside the patch.
+    """
+    coordinates = np.array(list(pixels), dtype=np.intp).reshape(
+        -1, len(patch.pixel_shape)
+    ) - np.array(patch.coordinate_offset)
+    inside = np.all((coordinates >= 0) & (coordinates < patch.pixel_shape), axis=1)
+    if not np.any(inside):
+        return set()
+    nodes = np.ravel_multi_index(tuple(coordinates[inside].T), patch.pixel_shape)
+
+    seed_data = np.mean(embedding.normalized_data[:, nodes], axis=1)
+    correlations = np.dot(seed_data, embedding.normalized_data)
+
+    is_selected = correlations < threshold
+    is_selected[nodes] = False
+    selected = np.unravel_index(np.flatnonzero(is_selected), patch.pixel_shape)
+    return add_offset_set_coordinates(
+        zip(*(x.tolist() for x in selected)), patch.coordinate_offset
+    )
 
 
 class CorrelationEmbedding:
@@ -41,11 +105,15 @@ class CorrelationEmbedding:
     If the correlation is not defined due to a pixel with zero variance, then the
     corelation is set to zero.
 
+    The time series of the pixels are normalized once, after which the correlation
+    matrix is computed as a single single-precision matrix product.
 
     Attributes:
         embedding (np.array): (D, N_1, N_2, ..) array of pairwise correlations, where D
             is the dimension of the embedding and N_1, N_2, .. are the pixel shape of
             the patch.
+        normalized_data (np.array): (T, P) array with the normalized time series of
+            the P pixels in the patch. See :func:`~.normalize_pixels`.
     """
 
     def __init__(self, patch):
@@ -58,8 +126,29 @@ class CorrelationEmbedding:
                 computed.
         """
         data = patch[:].reshape(-1, np.product(patch.pixel_shape))
-        self.embedding = np.corrcoef(data.T).reshape(-1, *patch.pixel_shape)
-        self.embedding[np.isnan(self.embedding)] = 0
+        self.normalized_data = normalize_pixels(data)
+
+        correlations = np.dot(self.normalized_data.T, self.normalized_data)
+        np.clip(correlations, -1.0, 1.0, out=correlations)
+        self.embedding = correlations.reshape(-1, *patch.pixel_shape)
+
+    @classmethod
+    def from_correlations(cls, normalized_data, correlations, pixel_shape):
+        """Initializes a CorrelationEmbedding object from a correlation matrix.
+
+        Args:
+            normalized_data (np.array): (T, P) array with the normalized time series of
+                the P pixels in the patch.
+            correlations (np.array): (P, P) correlation matrix of the pixels.
+            pixel_shape (tuple): Shape of the patch in pixels.
+
+        Returns:
+            CorrelationEmbedding: Embedding with the given correlations.
+        """
+        embedding = cls.__new__(cls)
+        embedding.normalized_data = normalized_data
+        embedding.embedding = correlations.reshape(-1, *pixel_shape)
+        return embedding
 
     def get_vector(self, pixel):
         """Retrieve feature vector of pixel.
@@ -73,6 +162,233 @@ class CorrelationEmbedding:
         return self.embedding[add_time_index(pixel)]
 
 
+class LowRankCorrelationEmbedding(CorrelationEmbedding):
+    """Low-rank approximation of the correlation feature vectors.
+
+    The correlation matrix of the patch is ``C = Z^T Z``, where ``Z`` is the (T, P)
+    matrix of normalized time series. Given the singular value decomposition
+    ``Z = U S V^T``, the difference between the correlation vectors of pixels i and j
+    satisfies ``||C_i - C_j|| = ||S^2 (V_i - V_j)||``. Each pixel is therefore
+    represented by the k-dimensional vector ``S_k^2 V_i`` of its top k singular
+    components, which preserves the distances between the correlation vectors up to the
+    truncated components. Memory and the cost of the similarity weights grow with
+    P x k instead of P x P.
+
+    The vectors are scaled by ``sqrt(k / P)``, such that the average squared difference
+    per feature, as used by :class:`~.ExponentialDistanceDecay`, matches the one of the
+    full :class:`~.CorrelationEmbedding`.
+
+    The top singular components are computed with a randomized SVD with a fixed random
+    state. The decomposition is exact if the rank is at least ``min(T, P)``.
+
+    Use :func:`functools.partial` to set the rank when passing the class as the
+    embedding class of HNCcorr, e.g. ``partial(LowRankCorrelationEmbedding, rank=20)``.
+
+    Attributes:
+        embedding (np.array): (k, N_1, N_2, ..) array of low-rank feature vectors, where
+            k is the rank of the embedding and N_1, N_2, .. are the pixel shape of the
+            patch.
+        normalized_data (np.array): (T, P) array with the normalized time series of
+            the P pixels in the patch. See :func:`~.normalize_pixels`.
+    """
+
+    def __init__(
+        # pylint: disable=C0330,W0231
+        self,
+        patch,
+        rank=30,
+        num_oversamples=10,
+        num_power_iterations=4,
+        random_state=0,
+    ):
+        """Initializes a LowRankCorrelationEmbedding object.
+
+        Args:
+            patch (Patch): Subregion of movie for which the embedding is computed.
+            rank (int): Number of singular components k in the embedding.
+            num_oversamples (int): Number of additional random vectors used to find the
+                range of the top singular components.
+            num_power_iterations (int): Number of power iterations in the randomized
+                range finder. Improves the accuracy for slowly decaying spectra.
+            random_state (int): Seed of the random test matrix.
+        """
+        num_pixels = int(np.product(patch.pixel_shape))
+        data = patch[:].reshape(-1, num_pixels)
+        self.normalized_data = normalize_pixels(data)
+
+        singular_values, right_vectors = self._top_singular_components(
+            self.normalized_data,
+            rank,
+            num_oversamples,
+            num_power_iterations,
+            random_state,
+        )
+        rank = len(singular_values)
+
+        scale = np.sqrt(rank / float(num_pixels))
+        features = (singular_values ** 2 * scale)[:, None] * right_vectors
+        self.embedding = features.astype(self.normalized_data.dtype).reshape(
+            rank, *patch.pixel_shape
+        )
+
+    @staticmethod
+    def _top_singular_components(
+        # pylint: disable=C0330
+        matrix,
+        rank,
+        num_oversamples,
+        num_power_iterations,
+        random_state,
+    ):
+        """Computes the top singular values and right singular vectors of a matrix.
+
+        Returns:
+            tuple: (k,) array of singular values and (k, P) array of right singular
+            vectors.
+        """
+        rank = min(rank, *matrix.shape)
+        num_samples = min(rank + num_oversamples, *matrix.shape)
+
+        if num_samples == min(matrix.shape):
+            _, singular_values, right_vectors = np.linalg.svd(
+                matrix, full_matrices=False
+            )
+            return singular_values[:rank], right_vectors[:rank]
+
+        random_matrix = (
+            np.random.RandomState(random_state)
+            .standard_normal((matrix.shape[1], num_samples))
+            .astype(matrix.dtype)
+        )
+        basis, _ = np.linalg.qr(np.dot(matrix, random_matrix))
+        for _ in range(num_power_iterations):
+            basis, _ = np.linalg.qr(np.dot(matrix.T, basis))
+            basis, _ = np.linalg.qr(np.dot(matrix, basis))
+
+        _, singular_values, right_vectors = np.linalg.svd(
+            np.dot(basis.T, matrix), full_matrices=False
+        )
+        return singular_values[:rank], right_vectors[:rank]
+
+
+class IncrementalCorrelationEmbedding:
+    """Provides correlation embeddings that reuse the overlap with the previous patch.
+
+    Consecutive candidates are often close, such that their patches overlap. The
+    normalized time series of a pixel and the correlation between two pixels do not
+    depend on the patch. The provider keeps the normalized time series and the
+    correlation matrix of the last patch. For a patch that overlaps the last patch of
+    the same movie, the overlapping block of the correlation matrix is copied, and only
+    the rows and columns of the pixels that enter the patch are computed. This reduces
+    the cost of the embedding roughly in proportion to the overlap.
+
+    The embeddings match those of :class:`~.CorrelationEmbedding` up to floating
+    point rounding. The rounding depends on the patches evaluated before, so the
+    provider is not supported by :meth:`~.HNCcorr.segment` with multiple workers. Use
+    an instance as the embedding class of HNCcorr. The provider is pickled without the
+    last patch. It holds a weak reference to the movie of the last patch, such that
+    the movie is not kept in memory by the provider.
+
+    Attributes:
+        _last (tuple or None): Weak reference to the movie, coordinate offset and
+            embedding of the last patch.
+    """
+
+    def __init__(self):
+        """Initializes an IncrementalCorrelationEmbedding object."""
+        self._last = None
+
+    def __call__(self, patch):
+        """Computes the correlation embedding of a patch.
+
+        Args:
+            patch (Patch): Subregion of movie for which the correlation embedding is
+                computed.
+
+        Returns:
+            CorrelationEmbedding: Correlation embedding of the patch.
+        """
+        # pylint: disable=W0212
+        overlap = self._overlap(patch)
+        if overlap is None:
+            embedding = CorrelationEmbedding(patch)
+        else:
+            embedding = self._update(patch, *overlap)
+
+        self._last = (
+            weakref.ref(patch._movie),
+            tuple(patch.coordinate_offset),
+            embedding,
+        )
+        return embedding
+
+    def _overlap(self, patch):
+        """Determines the overlap of a patch with the last patch.
+
+        Returns:
+            tuple or None: Slices of the overlap in the coordinates of the last patch
+            and of the patch. None if the patches do not overlap or the last patch
+            belongs to another movie or has another shape.
+        """
+        # pylint: disable=W0212
+        if self._last is None:
+            return None
+        movie, offset, embedding = self._last
+        if movie() is not patch._movie or embedding.embedding.shape[1:] != tuple(
+            patch.pixel_shape
+        ):
+            return None
+
+        start = np.maximum(offset, patch.coordinate_offset)
+        stop = np.minimum(offset, patch.coordinate_offset) + patch.pixel_shape
+        if np.any(stop <= start):
+            return None
+
+        return tuple(
+            tuple(slice(a - o, b - o) for a, b, o in zip(start, stop, corner))
+            for corner in (offset, patch.coordinate_offset)
+        )
+
+    def _update(self, patch, last_window, window):
+        """Computes the embedding of a patch from the embedding of the last patch."""
+        last = self._last[2]
+        pixel_shape = tuple(patch.pixel_shape)
+        num_pixels = int(np.product(pixel_shape))
+
+        is_entering = np.ones(pixel_shape, dtype=bool)
+        is_entering[window] = False
+        entering = np.flatnonzero(is_entering)
+
+        normalized_data = np.empty(
+            (patch.num_frames, num_pixels), dtype=last.normalized_data.dtype
+        )
+        normalized_data.reshape((-1,) + pixel_shape)[(slice(None),) + window] = (
+            last.normalized_data.reshape((-1,) + pixel_shape)[
+                (slice(None),) + last_window
+            ]
+        )
+        normalized_data[:, entering] = normalize_pixels(
+            patch[:][:, is_entering], dtype=normalized_data.dtype
+        )
+
+        correlations = np.empty((num_pixels, num_pixels), dtype=normalized_data.dtype)
+        correlations.reshape(pixel_shape * 2)[window * 2] = last.embedding.reshape(
+            pixel_shape * 2
+        )[last_window * 2]
+        entering_correlations = np.dot(normalized_data.T, normalized_data[:, entering])
+        np.clip(entering_correlations, -1.0, 1.0, out=entering_correlations)
+        correlations[:, entering] = entering_correlations
+        correlations[entering, :] = entering_correlations.T
+
+        return CorrelationEmbedding.from_correlations(
+            normalized_data, correlations, pixel_shape
+        )
+
+    def __getstate__(self):
+        """Returns the state of the provider without the last patch."""
+        return {"_last": None}
+
+
 def exponential_distance_decay(feature_vec1, feature_vec2, alpha):
     """Computes ``exp(- alpha / n || x_1 - x_2 ||^2_2)`` for x_1, x_2 in R^n."""
     num_frames = float(feature_vec1.shape[0])
@@ -81,25 +397,226 @@ def exponential_distance_decay(feature_vec1, feature_vec2, alpha):
     )
 
 
+class ExponentialDistanceDecay:
+    """Similarity weight that decays exponentially with the squared distance.
+
+    Computes ``exp(- alpha / n || x_1 - x_2 ||^2_2)`` for feature vectors x_1, x_2 in
+    R^n. Weights can be computed for a single pair of feature vectors or for a batch
+    of edges at once.
+
+    Attributes:
+        _alpha (float): Decay factor.
+        _max_chunk_bytes (int): Upper bound in bytes on the temporary arrays used in
+            a batch computation. Batches of edges are processed in chunks that respect
+            this bound.
+    """
+
+    def __init__(self, alpha, max_chunk_bytes=2 ** 26):
+        """Initializes an ExponentialDistanceDecay object."""
+        self._alpha = alpha
+        self._max_chunk_bytes = max_chunk_bytes
+
+    def __call__(self, feature_vec1, feature_vec2):
+        """Computes the weight for a pair of feature vectors."""
+        return exponential_distance_decay(feature_vec1, feature_vec2, self._alpha)
+
+    def compute_batch(self, embedding, nodes1, nodes2):
+        """Computes the weights for a batch of edges.
+
+        Args:
+            embedding (CorrelationEmbedding): Provides feature vectors of the pixels.
+            nodes1 (np.array): (E,) array with the first pixel of each edge. Pixels are
+                identified by their index in the flattened patch.
+            nodes2 (np.array): (E,) array with the second pixel of each edge.
+
+        Returns:
+            np.array: (E,) array with the weight of each edge.
+        """
+        num_features = embedding.embedding.shape[0]
+        vectors = embedding.embedding.reshape(num_features, -1)
+
+        # three (n, chunk) arrays are alive at once: two feature matrices and their
+        # difference.
+        chunk_size = max(
+            1, self._max_chunk_bytes // (3 * num_features * vectors.itemsize)
+        )
+
+        squared_distances = np.empty(len(nodes1))
+        for start in range(0, len(nodes1), chunk_size):
+            stop = start + chunk_size
+            difference = vectors[:, nodes1[start:stop]] - vectors[:, nodes2[start:stop]]
+            squared_distances[start:stop] = np.einsum(
+                "ij,ij->j", difference, difference
+            )
+
+        return np.exp(-self._alpha * squared_distances / float(num_features))
+
+
+class PairwiseWeightFunction:
+    """Adapter that provides a batch interface for a pairwise weight function.
+
+    Attributes:
+        _weight_function (function): Function that computes the edge weight between two
+            pixels. The function should take as input two 1-dimensional numpy arrays,
+            representing the feature vectors of the two pixels.
+    """
+
+    def __init__(self, weight_function):
+        """Initializes a PairwiseWeightFunction object."""
+        self._weight_function = weight_function
+
+    def __call__(self, feature_vec1, feature_vec2):
+        """Computes the weight for a pair of feature vectors."""
+        return self._weight_function(feature_vec1, feature_vec2)
+
+    def compute_batch(self, embedding, nodes1, nodes2):
+        """Computes the weights for a batch of edges one edge at a time.
+
+        See :meth:`~.ExponentialDistanceDecay.compute_batch` for the arguments.
+        """
+        pixel_shape = embedding.embedding.shape[1:]
+        pixels1 = zip(*(c.tolist() for c in np.unravel_index(nodes1, pixel_shape)))
+        pixels2 = zip(*(c.tolist() for c in np.unravel_index(nodes2, pixel_shape)))
+
+        return np.array(
+            [
+                self._weight_function(
+                    embedding.get_vector(pixel1), embedding.get_vector(pixel2)
+                )
+                for pixel1, pixel2 in zip(pixels1, pixels2)
+            ],
+            dtype=np.float64,
+        )
+
+
+class SimilarityGraph:
+    """Undirected similarity graph over the pixels of a patch.
+
+    The nodes of the graph are the pixels of the patch. Each node is identified by the
+    index of its pixel in the flattened (row-major) patch. Node indices are mapped to
+    movie coordinates through the coordinate offset of the patch.
+
+    The edges are stored in coordinate format: edge ``k`` connects the nodes
+    ``heads[k]`` and ``tails[k]`` and has weight ``weights[k]``. Each edge is stored
+    once.
+
+    Attributes:
+        coordinate_offset (tuple): Movie coordinates of the top left pixel of the patch.
+        heads (np.array): (E,) array with the first node of each edge.
+        pixel_shape (tuple): Shape of the patch in pixels.
+        tails (np.array): (E,) array with the second node of each edge.
+        weights (np.array): (E,) array with the similarity weight of each edge.
+    """
+
+    def __init__(
+        # pylint: disable=C0330
+        self,
+        pixel_shape,
+        coordinate_offset,
+        heads,
+        tails,
+        weights,
+    ):
+        """Initializes a SimilarityGraph object."""
+        self.pixel_shape = tuple(pixel_shape)
+        self.coordinate_offset = tuple(coordinate_offset)
+        self.heads = np.asarray(heads, dtype=np.int32)
+        self.tails = np.asarray(tails, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+    @property
+    def num_nodes(self):
+        """Number of nodes in the graph."""
+        return int(np.product(self.pixel_shape))
+
+    @property
+    def num_edges(self):
+        """Number of (undirected) edges in the graph."""
+        return len(self.weights)
+
+    def degrees(self):
+        """Computes the weighted degree of each node.
+
+        Returns:
+            np.array: (N,) array with the sum of the weights of the edges adjacent to
+            each node.
+        """
+        return np.bincount(
+            self.heads, weights=self.weights, minlength=self.num_nodes
+        ) + np.bincount(self.tails, weights=self.weights, minlength=self.num_nodes)
+
+    def to_movie_coordinates(self, nodes):
+        """Converts node indices into movie coordinates.
+
+        Args:
+            nodes (np.array): Array of node indices.
+
+        Returns:
+            list[tuple]: Movie coordinates of each node.
+        """
+        patch_coordinates = np.unravel_index(
+            np.asarray(nodes, dtype=np.intp), self.pixel_shape
+        )
+        movie_coordinates = [
+            coordinates + offset
+            for coordinates, offset in zip(patch_coordinates, self.coordinate_offset)
+        ]
+        return list(zip(*(c.tolist() for c in movie_coordinates)))
+
+    def to_node_indices(self, coordinates):
+        """Converts movie coordinates into node indices.
+
+        Coordinates of pixels outside of the patch are ignored.
+
+        Args:
+            coordinates (iterable): Movie coordinates. Each coordinate is a tuple.
+
+        Returns:
+            np.array: Node indices of the pixels inside the patch.
+        """
+        coordinates = np.array(list(coordinates), dtype=np.intp).reshape(
+            -1, len(self.pixel_shape)
+        )
+        patch_coordinates = coordinates - np.array(self.coordinate_offset)
+        inside = np.all(
+            (patch_coordinates >= 0) & (patch_coordinates < self.pixel_shape), axis=1
+        )
+        return np.ravel_multi_index(
+            tuple(patch_coordinates[inside].T), self.pixel_shape
+        ).astype(np.int32)
+
+
 class GraphConstructor:
     """Graph constructor over a set of pixels.
 
     Constructs a similarity graph over the set of pixels in a patch. Edges are selected
     by an edge_selector and the similarity weight associated with each edge is computed
-    with the weight_function. Edge weights are stored under the attribute ``weight``.
+    with the weight_function.
 
-    A directed graph is used for efficiency. That is, arcs (i,j) and (j,i) are used to represent edge [i,j].
+    The weight function computes the weights of all edges at once through its
+    ``compute_batch(embedding, nodes1, nodes2)`` method, see
+    :class:`~.ExponentialDistanceDecay`. A function that computes the weight of a
+    single pair of pixels is wrapped in a :class:`~.PairwiseWeightFunction`.
 
     Attributes:
         _edge_selector (EdgeSelector): Object that constructs the edge set of the graph.
-        _weight_function (function): Function that computes the edge weight between two
-            pixels. The function should take as input two 1-dimensional numpy arrays,
-            representing the feature vectors of the two pixels. The function should
-            return a float between 0 and 1.
+        _weight_function (ExponentialDistanceDecay or PairwiseWeightFunction): Computes
+            the edge weights from the feature vectors of the pixels. Weights should be
+            between 0 and 1.
     """
 
     def __init__(self, edge_selector, weight_function):
-        """Initializes a graph constructor."""
+        """Initializes a graph constructor.
+
+        Args:
+            edge_selector (EdgeSelector): Object that constructs the edge set.
+            weight_function: Object with a ``compute_batch`` method or a function that
+                takes as input two 1-dimensional numpy arrays, representing the
+                feature vectors of two pixels, and returns their similarity weight.
+        """
+        if not hasattr(weight_function, "compute_batch"):
+            weight_function = PairwiseWeightFunction(weight_function)
+
         self._edge_selector = edge_selector
         self._weight_function = weight_function
 
@@ -114,29 +631,52 @@ class GraphConstructor:
                 each pixel in the patch.
 
         Returns:
-            nx.DiGraph: Similarity graph over pixels in patch.
+            SimilarityGraph: Similarity graph over pixels in patch.
         """
-        graph = nx.DiGraph()
+        if hasattr(self._edge_selector, "select_edge_indices"):
+            heads, tails = self._edge_selector.select_edge_indices(embedding)
+        else:
+            heads, tails = self._pairs_to_indices(
+                self._edge_selector.select_edges(embedding), patch.pixel_shape
+            )
 
-        graph.add_nodes_from(patch.enumerate_pixels())
+        weights = self._weight_function.compute_batch(embedding, heads, tails)
 
-        for node1, node2 in self._edge_selector.select_edges(embedding):
-            node1_movie = patch.to_movie_coordinate(node1)
-            node2_movie = patch.to_movie_coordinate(node2)
-            weight = self._weight_function(
-                embedding.get_vector(node1), embedding.get_vector(node2)
-            )
-            # add arc in both directions
-            graph.add_edge(node1_movie, node2_movie, weight=weight)
-            graph.add_edge(node2_movie, node1_movie, weight=weight)
+        return SimilarityGraph(
+            patch.pixel_shape, patch.coordinate_offset, heads, tails, weights
+        )
 
-        return graph
+    @staticmethod
+    def _pairs_to_indices(pairs, pixel_shape):
+        """Converts pixel pairs in patch coordinates into arrays of node indices.
+
+        Supports edge selectors that only provide ``select_edges()``.
+        """
+        pairs = list(pairs)
+        heads, tails = (
+            np.ravel_multi_index(
+                tuple(
+                    np.array([pair[i] for pair in pairs], dtype=np.intp)
+                    .reshape(-1, len(pixel_shape))
+                    .T
+                ),
+                pixel_shape,
+            )
+            for i in range(2)
+        )
+        return heads, tails
 
 
 class SparseComputationEmbeddingWrapper:
     """Wrapper for SparseComputation that accepts an embedding.
 
+    The wrapper is pickled by its parameters. The SparseComputation object is rebuilt
+    when the wrapper is unpickled.
+
     Attributes:
+        _dim_low (int): Dimension of the low-dimensional space in sparse computation.
+        _dimension_reducer (DimReducer or None): Dimension reducer provided by the user.
+        _distance (float): 1 / grid_resolution.
         _sc (SparseComputation): SparseComputation object.
     """
 
@@ -155,29 +695,74 @@ class SparseComputationEmbeddingWrapper:
             SparseComputationEmbeddingWrapper
 
         """
+        self._dim_low = dim_low
+        self._distance = distance
+        self._dimension_reducer = dimension_reducer
+
         if dimension_reducer is None:
             dimension_reducer = ApproximatePCA(int(dim_low))
 
         self._sc = SC(dimension_reducer, distance=distance)
 
-    def select_edges(self, embedding):
+    def __getstate__(self):
+        """Returns the parameters of the wrapper."""
+        return {
+            "dim_low": self._dim_low,
+            "distance": self._distance,
+            "dimension_reducer": self._dimension_reducer,
+        }
+
+    def __setstate__(self, state):
+        """Rebuilds the wrapper from its parameters."""
+        self.__init__(**state)
+
+    def select_edge_indices(self, embedding):
         """Selects relevant pairwise similarities with sparse computation.
 
         Determines the set of relevant pairwise similarities based on the sparse
-        computation algorithm. See sparse computation for details. Pixel coordinates
-        are with respect to the index of the embedding.
+        computation algorithm. See sparse computation for details. Pixels are
+        identified by their index in the flattened embedding.
+
+        Pairs are deduplicated and returned in canonical order: the first pixel of each
+        pair has the smaller index, and pairs are sorted lexicographically.
 
         Args:
             embedding (CorrelationEmbedding): Embedding of pixels into feature vectors.
 
         Returns:
-            list(tuple): List of relevant pixel pairs.
+            tuple[np.array, np.array]: Two (E,) int32 arrays with the first and second
+            pixel of each pair.
         """
         shape = embedding.embedding.shape[1:]
-        data = embedding.embedding.reshape(-1, np.product(shape)).T
+        num_pixels = int(np.product(shape))
+        data = embedding.embedding.reshape(-1, num_pixels).T
 
-        pairs = self._sc.select_pairs(data)
+        pairs = np.array(self._sc.select_pairs(data), dtype=np.int64).reshape(-1, 2)
 
-        return set(
-            (np.unravel_index(a, shape), np.unravel_index(b, shape)) for a, b in pairs
+        # encode each unordered pair as a single integer to deduplicate and sort
+        keys = np.unique(
+            np.amin(pairs, axis=1) * num_pixels + np.amax(pairs, axis=1)
         )
+        nodes1, nodes2 = np.divmod(keys, num_pixels)
+
+        return nodes1.astype(np.int32), nodes2.astype(np.int32)
+
+    def select_edges(self, embedding):
+        """Selects relevant pairwise similarities with sparse computation.
+
+        See :meth:`~.SparseComputationEmbeddingWrapper.select_edge_indices`. Pixel
+        coordinates are with respect to the index of the embedding.
+
+        Args:
+            embedding (CorrelationEmbedding): Embedding of pixels into feature vectors.
+
+        Returns:
+            set(tuple): Set of relevant pixel pairs.
+        """
+        shape = embedding.embedding.shape[1:]
+        nodes1, nodes2 = self.select_edge_indices(embedding)
+
+        pixels1 = zip(*(c.tolist() for c in np.unravel_index(nodes1, shape)))
+        pixels2 = zip(*(c.tolist() for c in np.unravel_index(nodes2, shape)))
+
+        return set(zip(pixels1, pixels2))
@@ -25,6 +25,8 @@
 
 import os
 import math
+import hashlib
+from multiprocessing import shared_memory
 import numpy as np
 from PIL import Image
 from PIL.TiffTags import TAGS
@@ -174,6 +176,64 @@ class Movie:
         """
         return self._data.__getitem__(key).astype(np.float64)
 
+    def fingerprint(self, chunk_size=100):
+        """Computes a fingerprint of the movie data.
+
+        The fingerprint is a hash of the shape, the data type, and the raw data of the
+        movie. Data is read in order in chunks of `chunk_size` frames, such that
+        memory-mapped movies are read once. Movies with identical data and data type
+        have the same fingerprint.
+
+        Args:
+            chunk_size (int): Number of frames to hash at once.
+
+        Returns:
+            str: Hexadecimal fingerprint of the movie.
+        """
+        fingerprint = hashlib.blake2b(digest_size=16)
+        fingerprint.update(str((self.data_size, self._data.dtype.str)).encode())
+
+        for start in range(0, self.num_frames, chunk_size):
+            frames = slice(start, start + chunk_size)
+            chunk = np.ascontiguousarray(self._data[frames])
+            fingerprint.update(chunk.data)
+
+        return fingerprint.hexdigest()
+
+    def crop(self, region, name=None):
+        """Provides a movie restricted to a spatial subregion.
+
+        The data of the cropped movie is a view of the data of this movie. Memory-mapped
+        data is therefore not loaded into memory. Pixels in the cropped movie are
+        indexed with respect to the start of the region.
+
+        Args:
+            region (tuple[slice]): One slice per spatial dimension.
+            name (str): Name of the cropped movie. Defaults to the name of this movie.
+
+        Returns:
+            Movie: Movie with the data of the subregion.
+        """
+        if name is None:
+            name = self.name
+        return Movie(name, self._data[add_time_index(tuple(region))])
+
+    def to_shared(self, chunk_size=100):
+        """Copies the movie into shared memory.
+
+        The returned movie stores its data in a shared memory block. Pickling the movie
+        only transfers a handle to the block, such that worker processes read the same
+        physical memory without a copy. See :class:`SharedMovie`.
+
+        Args:
+            chunk_size (int): Number of frames to copy at once. Limits the memory usage
+                for memory-mapped movies.
+
+        Returns:
+            SharedMovie: Movie with data in shared memory.
+        """
+        return SharedMovie.from_array(self.name, self._data, chunk_size=chunk_size)
+
     def is_valid_pixel_coordinate(self, coordinate):
         """Checks if coordinate is a coordinate for a pixel in the movie."""
         if self.num_dimensions != len(coordinate):
@@ -210,6 +270,95 @@ class Movie:
         return {pixel for pixel in pixels if self.is_valid_pixel_coordinate(pixel)}
 
 
+class SharedMovie(Movie):
+    """Calcium imaging movie with data in shared memory.
+
+    The data is stored in a :class:`multiprocessing.shared_memory.SharedMemory` block.
+    A pickled SharedMovie only contains the name of the block and the shape and data
+    type of the data. Unpickling attaches to the existing block, so movies sent to
+    worker processes share the data with the process that created the movie.
+
+    The process that created the movie owns the block. It should call :meth:`close`
+    when the movie is no longer needed in any process, which releases the block.
+    SharedMovie can also be used as a context manager.
+
+    Attributes:
+        _is_owner (bool): True if the movie created the shared memory block.
+        _shared_memory (SharedMemory): Shared memory block with the data.
+    """
+
+    def __init__(self, name, shared_memory_block, data_size, dtype, is_owner=False):
+        """Initializes a SharedMovie object from a shared memory block."""
+        data = np.ndarray(data_size, dtype=dtype, buffer=shared_memory_block.buf)
+        super().__init__(name, data)
+        self._shared_memory = shared_memory_block
+        self._is_owner = is_owner
+
+    @classmethod
+    def from_array(cls, name, data, chunk_size=100):
+        """Creates a shared movie with a copy of an array.
+
+        Args:
+            name (str): Movie name.
+            data (np.array like): (T, N_1, N_2, ..) array with the movie data.
+            chunk_size (int): Number of frames to copy at once.
+
+        Returns:
+            SharedMovie: Movie with a copy of the data in shared memory.
+        """
+        dtype = np.dtype(data.dtype)
+        block = shared_memory.SharedMemory(
+            create=True, size=max(1, int(np.product(data.shape)) * dtype.itemsize)
+        )
+        movie = cls(name, block, data.shape, dtype, is_owner=True)
+
+        for start in range(0, data.shape[0], chunk_size):
+            frames = slice(start, start + chunk_size)
+            movie._data[frames] = data[frames]
+
+        return movie
+
+    def __getstate__(self):
+        """Returns a handle to the shared memory block instead of the data."""
+        return {
+            "name": self.name,
+            "shared_memory_name": self._shared_memory.name,
+            "data_size": self.data_size,
+            "dtype": self._data.dtype.str,
+        }
+
+    def __setstate__(self, state):
+        """Attaches to the shared memory block of a pickled movie."""
+        self.__init__(
+            state["name"],
+            shared_memory.SharedMemory(name=state["shared_memory_name"]),
+            state["data_size"],
+            np.dtype(state["dtype"]),
+        )
+
+    def close(self):
+        """Detaches from the shared memory block. The owner also releases the block.
+
+        The movie data is not accessible after closing the movie.
+        """
+        if self._shared_memory is None:
+            return
+
+        self._data = None
+        self._shared_memory.close()
+        if self._is_owner:
+            self._shared_memory.unlink()
+        self._shared_memory = None
+
+    def __enter__(self):
+        """Returns the shared movie for use as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Closes the shared memory when the context is left."""
+        self.close()
+
+
 class Patch:
     """Square subregion of Movie.
 
@@ -246,7 +395,9 @@ class Patch:
         self._center_seed = center_seed
         self._patch_size = patch_size
         self._movie = movie
-        self._coordinate_offset = self._compute_coordinate_offset()
+        self._coordinate_offset = self.compute_coordinate_offset(
+            center_seed, patch_size, movie.pixel_shape
+        )
         self._data = self._movie[self._movie_indices()]
 
     @property
@@ -259,33 +410,48 @@ class Patch:
         """Shape of the patch in pixels. Does not not included the time dimension."""
         return (self._patch_size,) * self._num_dimensions
 
-    def _compute_coordinate_offset(self):
-        """Computes the coordinate offset of the patch.
+    @property
+    def coordinate_offset(self):
+        """Movie coordinates of the top left pixel of the patch."""
+        return self._coordinate_offset
+
+    @staticmethod
+    def compute_coordinate_offset(center_seed, patch_size, movie_pixel_shape):
+        """Computes the coordinate offset of a patch without reading the movie.
 
         Confirms that the patch falls within the movie boundaries and shifts the patch
         if necessary. The center seed pixel may not be in the center of the patch if a
         shift is necessary.
+
+        Args:
+            center_seed (tuple): Center seed of the patch.
+            patch_size (int): Length of the patch in each pixel dimension.
+            movie_pixel_shape (tuple): Pixel shape of the movie.
+
+        Returns:
+            tuple: Movie coordinates of the top left pixel of the patch.
         """
-        half_width = int((self._patch_size - 1) / 2)
+        num_dimensions = len(movie_pixel_shape)
+        half_width = int((patch_size - 1) / 2)
 
         topleft_coordinates = add_offset_to_coordinate(
-            self._center_seed, (-half_width,) * self._num_dimensions
+            center_seed, (-half_width,) * num_dimensions
         )
         # shift left such that top left corner exists
         topleft_coordinates = list(max(x, 0) for x in topleft_coordinates)
 
         # bottomright corners (python-style index so not included)
         bottomright_coordinates = add_offset_to_coordinate(
-            topleft_coordinates, (self._patch_size,) * self._num_dimensions
+            topleft_coordinates, (patch_size,) * num_dimensions
         )
         # shift right such that bottom right corner exists
         bottomright_coordinates = list(
             min(x, max_value)
-            for x, max_value in zip(bottomright_coordinates, self._movie.pixel_shape)
+            for x, max_value in zip(bottomright_coordinates, movie_pixel_shape)
         )
 
         topleft_coordinates = add_offset_to_coordinate(
-            bottomright_coordinates, (-self._patch_size,) * self._num_dimensions
+            bottomright_coordinates, (-patch_size,) * num_dimensions
         )
 
         return topleft_coordinates
@@ -52,9 +52,21 @@ class SizePostprocessor:
         return [
             s
             for s in segmentations
-            if self._min_size <= len(s.selection) <= self._max_size
+            if self._min_size <= s.size <= self._max_size
         ]
 
+    def is_size_feasible(self, lower_bound, upper_bound):
+        """Determines whether a segmentation with a size in a range can be selected.
+
+        Args:
+            lower_bound (int): Lower bound on the number of pixels of a segmentation.
+            upper_bound (int): Upper bound on the number of pixels of a segmentation.
+
+        Returns:
+            bool: True if the range intersects ``[_min_size, _max_size]``.
+        """
+        return lower_bound <= self._max_size and upper_bound >= self._min_size
+
     def select(self, segmentations):
         """Selects the best segmentation based on the number of selected pixels.
 
@@ -69,7 +81,7 @@ class SizePostprocessor:
         candidates = self._filter(segmentations)
         if not candidates:
             return None
-        size = np.array([len(c.selection) for c in candidates])
+        size = np.array([c.size for c in candidates])
         best_index = np.argmin(np.abs(np.sqrt(size) - np.sqrt(self._pref_size)))
 
         return candidates[best_index]
@@ -24,14 +24,14 @@
 """Seed related components of HNCcorr."""
 
 from math import sin, cos, pi
-import itertools
+import os
 import numpy as np
+from scipy.ndimage import binary_dilation
 
 from hnccorr.utils import (
     add_offset_set_coordinates,
     add_time_index,
     eight_neighborhood,
-    generate_pixels,
 )
 
 
@@ -49,10 +49,20 @@ class LocalCorrelationSeeder:
     `_neighborhood_size` centered on the pixels. Pixel coordinates outside the boundary
     of the movie are ignored.
 
+    If a cache directory is provided, the average local correlation of each pixel is
+    stored in a ``.npy`` file in that directory. The file is identified by the
+    fingerprint of the movie and the neighborhood size. Later calls to `select_seeds()`
+    for the same movie load the scores from the cache instead of recomputing them.
+
 
     Attributes:
+        _cache_dir (str or None): Directory for cached local correlation scores. No
+            scores are cached if None.
+        _chunk_size (int): Number of frames read at once when computing the local
+            correlations.
         _current_index (int): Index of next seed in `_seeds` to return.
-        _excluded_pixels (set): Set of pixel coordinates to excluded as future seeds.
+        _excluded_pixels (np.array): Boolean array of size `movie.pixel_shape`. Pixels
+            marked True are excluded as future seeds.
         _grid_size (int): Number of pixels per dimension in a block.
         _keep_fraction (float): Percentage of candidate seed pixels to attempt for
             segmentation. All other candidate seed pixels are discarded.
@@ -63,10 +73,21 @@ class LocalCorrelationSeeder:
         _seeds (list[tuple]): List of candidate seed coordinates to return.
     """
 
-    def __init__(self, neighborhood_size, keep_fraction, padding, grid_size):
+    def __init__(
+        # pylint: disable=C0330
+        self,
+        neighborhood_size,
+        keep_fraction,
+        padding,
+        grid_size,
+        chunk_size=100,
+        cache_dir=None,
+    ):
         """Initializes a LocalCorrelationSeeder object."""
+        self._cache_dir = cache_dir
+        self._chunk_size = chunk_size
         self._current_index = None
-        self._excluded_pixels = set()
+        self._excluded_pixels = None
         self._keep_fraction = keep_fraction
         self._movie = None
         self._neighborhood_size = neighborhood_size
@@ -89,104 +110,217 @@ class LocalCorrelationSeeder:
         """
         self._movie = movie
 
-        num_dimensions = self._movie.num_dimensions
-        # helpful constants
-        max_shift = int((self._neighborhood_size - 1) / 2)
-
-        # generate all offsets of neighbors
-        neighbor_offsets = eight_neighborhood(num_dimensions, max_shift)
-        # remove point as neighbor
-        neighbor_offsets = neighbor_offsets - {(0,) * num_dimensions}
+        scores = self._load_or_compute_local_correlation_image()
 
-        mean_neighbor_corr = {}
+        coordinates, values = self._select_best_per_grid_block(scores)
 
-        for pixel in generate_pixels(self._movie.pixel_shape):
-            # compute neighbors
-            neighbors = add_offset_set_coordinates(neighbor_offsets, pixel)
+        num_keep = int(self._keep_fraction * len(values))
+        best_indices = self._select_top_indices(values, num_keep)
 
-            # extract data for valid neighbors
-            valid_neighbors = [
-                neighbor
-                for neighbor in neighbors
-                if self._movie.is_valid_pixel_coordinate(neighbor)
-            ]
+        # store best seeds
+        self._seeds = [tuple(seed) for seed in coordinates[best_indices].tolist()]
+        self.reset()
 
-            # store average correlation
-            mean_neighbor_corr[pixel] = self._compute_average_local_correlation(
-                pixel, valid_neighbors
-            )
+    def _load_or_compute_local_correlation_image(self):
+        """Provides the local correlation scores from the cache if available.
 
-        best_per_grid_block = self._select_best_per_grid_block(mean_neighbor_corr)
+        Scores are computed when no cache directory is set or when they are not yet
+        cached. Newly computed scores are added to the cache.
+        """
+        if self._cache_dir is None:
+            return self._compute_local_correlation_image()
 
-        best_per_grid_block_sorted = sorted(
-            [(key, val) for key, val in best_per_grid_block.items()],
-            key=lambda x: x[1],
-            reverse=True,
+        cache_file = os.path.join(
+            self._cache_dir,
+            "local_correlation_%s_%d.npy"
+            % (self._movie.fingerprint(), self._neighborhood_size),
         )
 
-        num_keep = int(self._keep_fraction * len(best_per_grid_block_sorted))
+        if os.path.isfile(cache_file):
+            return np.load(cache_file)
 
-        # store best seeds
-        self._seeds = [seed for seed, _ in best_per_grid_block_sorted[:num_keep]]
-        self.reset()
+        scores = self._compute_local_correlation_image()
+
+        # write to a temporary file first such that concurrent runs never read a
+        # partially written cache file.
+        os.makedirs(self._cache_dir, exist_ok=True)
+        temporary_file = "%s.%d.tmp" % (cache_file, os.getpid())
+        with open(temporary_file, "wb") as file:
+            np.save(file, scores)
+        os.replace(temporary_file, cache_file)
+
+        return scores
+
+    def _compute_local_correlation_image(self):
+        """Computes the average correlation between each pixel and its neighbors.
+
+        The movie is read once, in order, in chunks of `_chunk_size` frames. For each
+        chunk, the sufficient statistics for the correlations are accumulated: the sum
+        and the sum of squares of each pixel and the sum of cross products between each
+        pixel and each of its neighbors. Peak memory therefore depends on the chunk
+        size and not on the number of frames. Each offset and its opposite describe the
+        same pixel pairs, so only one of the two is evaluated.
+
+        Returns:
+            np.array: (N_1, N_2, ...) array with the average local correlation of each
+            pixel.
+        """
+        pixel_shape = self._movie.pixel_shape
+        num_frames = self._movie.num_frames
 
-    def _compute_average_local_correlation(self, pixel, valid_neighbors):
-        """Compute average correlation between pixel and neighbors."""
-        pixel_data = self._movie[add_time_index(pixel)].reshape(1, -1)
+        overlapping_slices = [
+            self._overlapping_slices(pixel_shape, offset)
+            for offset in self._neighbor_offsets(self._movie.num_dimensions)
+        ]
 
-        # extract data for valid neighbors
-        neighbors_data = []
-        for neighbor in valid_neighbors:
-            neighbors_data.append(self._movie[add_time_index(neighbor)].reshape(1, -1))
-        neighbors_data = np.concatenate(neighbors_data, axis=0)
+        pixel_sum = np.zeros(pixel_shape)
+        pixel_sum_squares = np.zeros(pixel_shape)
+        cross_sums = [
+            np.zeros(pixel_sum[pixels].shape) for pixels, _ in overlapping_slices
+        ]
 
-        # compute correlation to each neighbor (corrcoef concatenates the
-        # two vectors so we extract last row except for last element)
-        neighbors_corr = np.corrcoef(neighbors_data, pixel_data)[-1, :-1]
+        reference_frame = None
+        for start in range(0, num_frames, self._chunk_size):
+            stop = min(start + self._chunk_size, num_frames)
+            chunk = self._movie[start:stop]
+
+            # Shifting all frames by the first frame does not affect correlations but
+            # limits cancellation errors in the sums.
+            if reference_frame is None:
+                reference_frame = chunk[0].copy()
+            chunk = chunk - reference_frame
+
+            pixel_sum += np.sum(chunk, axis=0)
+            pixel_sum_squares += np.sum(chunk ** 2, axis=0)
+            for (pixels, neighbors), cross_sum in zip(overlapping_slices, cross_sums):
+                cross_sum += np.sum(
+                    chunk[add_time_index(pixels)] * chunk[add_time_index(neighbors)],
+                    axis=0,
+                )
+
+        # pixels with zero variance have an undefined correlation (NaN) to all pixels
+        norm = np.sqrt(np.maximum(pixel_sum_squares - pixel_sum ** 2 / num_frames, 0))
+
+        corr_sum = np.zeros(pixel_shape)
+        num_neighbors = np.zeros(pixel_shape)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for (pixels, neighbors), cross_sum in zip(overlapping_slices, cross_sums):
+                covariance = (
+                    cross_sum - pixel_sum[pixels] * pixel_sum[neighbors] / num_frames
+                )
+                corr = np.clip(covariance / (norm[pixels] * norm[neighbors]), -1, 1)
+
+                corr_sum[pixels] += corr
+                corr_sum[neighbors] += corr
+                num_neighbors[pixels] += 1
+                num_neighbors[neighbors] += 1
+
+            return corr_sum / num_neighbors
+
+    def _neighbor_offsets(self, num_dimensions):
+        """Returns neighbor offsets in the local neighborhood, up to a reversal.
+
+        Offsets ``x`` and ``-x`` describe the same pixel pairs. Only the
+        lexicographically positive one of the two is returned.
+        """
+        max_shift = int((self._neighborhood_size - 1) / 2)
 
-        # store average correlation
-        return np.mean(neighbors_corr)
+        return sorted(
+            offset
+            for offset in eight_neighborhood(num_dimensions, max_shift)
+            if offset > (0,) * num_dimensions
+        )
+
+    @staticmethod
+    def _overlapping_slices(pixel_shape, offset):
+        """Computes the pixels that have a valid neighbor at the given offset.
+
+        Returns:
+            tuple[tuple, tuple]: Index of pixels ``p`` and index of the corresponding
+            neighbors ``p + offset``. Both only include valid pixel coordinates.
+        """
+        pixels = tuple(
+            slice(max(-shift, 0), length - max(shift, 0))
+            for length, shift in zip(pixel_shape, offset)
+        )
+        neighbors = tuple(
+            slice(max(shift, 0), length - max(-shift, 0))
+            for length, shift in zip(pixel_shape, offset)
+        )
+        return pixels, neighbors
 
     def _select_best_per_grid_block(self, scores):
         """Selects pixel with highest score in a block of grid_size pixels per dim.
 
+        The score array is padded to a multiple of the grid size such that all blocks
+        have the same shape. Each block is then flattened and reduced with an argmax.
+        Pixels with an undefined (NaN) score are never preferred over other pixels.
+
+        Args:
+            scores (np.array): (N_1, N_2, ...) array with the score of each pixel.
+
+        Returns:
+            tuple[np.array, np.array]: (B, D) array with the coordinates of the best
+            pixel in each block and (B,) array with their scores, where B is the
+            number of blocks and D is the number of dimensions. Blocks are ordered
+            from the top left corner of the movie.
         """
-        pixel_shape = self._movie.pixel_shape
-        num_dimensions = self._movie.num_dimensions
+        grid_size = self._grid_size
+        num_dimensions = scores.ndim
+        num_blocks = tuple(-(-length // grid_size) for length in scores.shape)
 
-        best_pixels = {}
+        padded_scores = np.full([n * grid_size for n in num_blocks], -np.inf)
+        padded_scores[tuple(slice(0, length) for length in scores.shape)] = np.where(
+            np.isnan(scores), -np.inf, scores
+        )
 
-        # identify all pixels in a block relatve to top left pixel as base coordinate
-        shifts = set(
-            itertools.product(*(range(self._grid_size) for _ in range(num_dimensions)))
+        # reshape to (B_1, B_2, ..., grid_size ** D) such that each block is a row
+        blocks = padded_scores.reshape(
+            [size for n in num_blocks for size in (n, grid_size)]
         )
+        blocks = blocks.transpose(
+            list(range(0, 2 * num_dimensions, 2))
+            + list(range(1, 2 * num_dimensions, 2))
+        ).reshape(num_blocks + (grid_size ** num_dimensions,))
 
-        # loop over all base coordinates of the grid, e.g. (0, 0), (5, 0), (0, 5),
-        # (5, 5), (10, 0), ... for grid_size = 5
-        for base_coordinate in itertools.product(
-            *(range(0, pixel_shape[i], self._grid_size) for i in range(num_dimensions))
-        ):
-            # list of all coordinates in the block
-            coordinates_in_block = add_offset_set_coordinates(shifts, base_coordinate)
-            # select coordinate in block with highest score
-            best_coordinate, best_value = max(
-                [
-                    (coordinate, scores[coordinate])
-                    for coordinate in coordinates_in_block
-                    if coordinate in scores
-                ],
-                key=lambda x: x[1],
-            )
-
-            best_pixels[best_coordinate] = best_value
-
-        return best_pixels
+        best_in_block = np.argmax(blocks, axis=-1)
+        values = np.take_along_axis(blocks, best_in_block[..., np.newaxis], axis=-1)
+
+        # top left pixel of each block plus the position of the best pixel in the block
+        coordinates = np.indices(num_blocks) * grid_size + np.array(
+            np.unravel_index(best_in_block, (grid_size,) * num_dimensions)
+        )
+
+        return coordinates.reshape(num_dimensions, -1).T, values.ravel()
+
+    @staticmethod
+    def _select_top_indices(values, num_keep):
+        """Returns the indices of the `num_keep` largest values in descending order.
+
+        Only the kept values are sorted. Ties are broken in favor of the lowest index,
+        as with a stable sort of all values.
+        """
+        if num_keep <= 0:
+            return np.array([], dtype=int)
+
+        if num_keep < len(values):
+            threshold = -np.partition(-values, num_keep - 1)[num_keep - 1]
+            above = np.flatnonzero(values > threshold)
+            ties = np.flatnonzero(values == threshold)[: num_keep - len(above)]
+            kept = np.sort(np.concatenate([above, ties]))
+        else:
+            kept = np.arange(len(values))
+
+        return kept[np.argsort(-values[kept], kind="stable")]
 
     def exclude_pixels(self, pixels):
         """Excludes pixels from being returned by `next()` method.
 
         All pixels within in the set `pixels` as well as pixels that are within an L-
         infinity distance of `_padding` from any excluded pixel are excluded as seeds.
+        The padded pixels are obtained by a morphological dilation of the pixels with a
+        square of width ``2 * _padding + 1``.
 
         Method enables exclusion of pixels in previously segmented cells from serving
         as new seeds. This may help to prevent repeated segmentation of the cell.
@@ -197,15 +331,35 @@ class LocalCorrelationSeeder:
         Returns:
             None
         """
-        neighborhood = eight_neighborhood(self._movie.num_dimensions, self._padding)
+        if not pixels:
+            return
 
-        padded_pixel_sets = [
-            add_offset_set_coordinates(neighborhood, pixel) for pixel in pixels
-        ]
+        pixel_shape = self._movie.pixel_shape
+        coordinates = np.array(list(pixels)).T
 
-        self._excluded_pixels = self._excluded_pixels.union(
-            pixels.union(*padded_pixel_sets)
+        # only the bounding box of the pixels and their padding is updated
+        lower = np.maximum(np.amin(coordinates, axis=1) - self._padding, 0)
+        upper = np.minimum(
+            np.amax(coordinates, axis=1) + self._padding + 1, pixel_shape
         )
+        bounding_box = tuple(slice(start, stop) for start, stop in zip(lower, upper))
+
+        footprint = np.zeros(upper - lower, dtype=bool)
+        footprint[tuple(coordinates - lower.reshape(-1, 1))] = True
+
+        structure = np.ones((2 * self._padding + 1,) * len(pixel_shape), dtype=bool)
+        self._excluded_pixels[bounding_box] |= binary_dilation(footprint, structure)
+
+    def is_excluded(self, pixel):
+        """Determines whether a pixel is excluded as a seed.
+
+        Args:
+            pixel (tuple): Coordinates of pixel.
+
+        Returns:
+            bool: True if the pixel is excluded, False otherwise.
+        """
+        return bool(self._excluded_pixels[pixel])
 
     def next(self):
         """Provides next seed pixel for segmentation.
@@ -221,7 +375,7 @@ class LocalCorrelationSeeder:
             center_seed = self._seeds[self._current_index]
             self._current_index += 1
 
-            if center_seed not in self._excluded_pixels:
+            if not self.is_excluded(center_seed):
                 return center_seed
 
         return None
@@ -229,7 +383,8 @@ class LocalCorrelationSeeder:
     def reset(self):
         """Reinitialize the sequence of seed pixels and empties `_excluded_seeds`."""
         self._current_index = 0
-        self._excluded_pixels = set()
+        if self._movie is not None:
+            self._excluded_pixels = np.zeros(self._movie.pixel_shape, dtype=bool)
 
 
 class NegativeSeedSelector:
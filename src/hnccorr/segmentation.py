@@ -24,14 +24,21 @@
 """HNC and segmentation related components in HNCcorr."""
 
 from copy import deepcopy
-from itertools import product
-import networkx as nx
+from ctypes import POINTER, byref, c_double, c_int, c_void_p, cdll
+import os
+
 import numpy as np
-from scipy.ndimage.morphology import binary_fill_holes
+from scipy.ndimage import (
+    binary_fill_holes,
+    find_objects,
+    generate_binary_structure,
+    label,
+)
 
 from closure.hnc import HNC as HNC_Closure
+import pseudoflow
 
-from hnccorr.utils import four_neighborhood
+from hnccorr.graph import SimilarityGraph
 
 
 class HncParametricWrapper:
@@ -84,44 +91,432 @@ class HncParametricWrapper:
         simultaneously. See class description for a definition of HNC.
 
         Args:
-            graph (nx.Graph): Directed similarity graph with non-negative edge
-                weights. Edge [i,j] is represented by two directed arcs (i,j) and
-                (j,i). Edge weights must be defined via the attribute `weight`.
+            graph (SimilarityGraph or nx.DiGraph): Similarity graph with non-negative
+                edge weights. A networkx graph should be directed with edge [i,j]
+                represented by two directed arcs (i,j) and (j,i). Edge weights must be
+                defined via the attribute `weight`.
             pos_seeds (set): Set of nodes in graph that must be part of the cluster.
+                For a SimilarityGraph, nodes are given by their movie coordinates.
             neg_seeds (set): Set of nodes in graph that must be part of the complement.
+                For a SimilarityGraph, nodes are given by their movie coordinates.
 
         Returns:
             list[Segmentation]: List of optimal clusters for each lambda range.
 
         Caution:
-            Class modifies graph for performance. Pass a copy to prevent any issues.
+            Class modifies networkx graphs for performance. Pass a copy to prevent any
+            issues.
         """
+        if isinstance(graph, SimilarityGraph):
+            return self._solve_similarity_graph(graph, pos_seeds, neg_seeds)
+
         hnc = HNC_Closure(graph, pos_seeds, neg_seeds, arc_weight="weight")
         source_sets, breakpoints = hnc.solve_parametric(
             self._lower_bound, self._upper_bound
         )
         return self._construct_segmentations(source_sets, breakpoints)
 
+    def _solve_similarity_graph(self, graph, pos_seeds, neg_seeds):
+        """Solves the HNC problem on a SimilarityGraph.
+
+        The cut problem is passed to the pseudoflow solver directly from the edge
+        arrays, see :class:`HncArrayProblem`. Each source set is converted into a mask
+        over the patch.
+        """
+        hnc = HncArrayProblem(
+            graph.num_nodes,
+            graph.heads,
+            graph.tails,
+            graph.weights,
+            graph.to_node_indices(pos_seeds),
+            graph.to_node_indices(neg_seeds),
+        )
+        source_sets, breakpoints = hnc.solve_parametric(
+            self._lower_bound, self._upper_bound
+        )
+        segmentations = []
+        for source_set, weight in zip(source_sets, breakpoints):
+            mask = np.zeros(graph.num_nodes, dtype=bool)
+            mask[source_set] = True
+            segmentations.append(
+                Segmentation.from_mask(
+                    mask.reshape(graph.pixel_shape), graph.coordinate_offset, weight
+                )
+            )
+        return segmentations
+
+
+def _load_hpf_library():
+    """Loads the C library of the pseudoflow package.
+
+    The signatures of its functions are declared as in ``pseudoflow/python/hpf.py``,
+    such that a call that does not match the interface raises an error.
+
+    Returns:
+        ctypes.CDLL: Pseudoflow library.
+    """
+    library = cdll.LoadLibrary(
+        os.path.join(os.path.dirname(pseudoflow.__file__), "libhpf.so")
+    )
+    library.hpf_solve.argtypes = [
+        c_int,
+        c_int,
+        c_int,
+        c_int,
+        POINTER(c_double),
+        c_double * 2,
+        c_int,
+        POINTER(c_int),
+        POINTER(POINTER(c_int)),
+        POINTER(POINTER(c_double)),
+        c_int * 5,
+        c_double * 3,
+    ]
+    library.hpf_solve.restype = None
+    library.libfree.argtypes = [c_void_p]
+    library.libfree.restype = None
+    return library
+
+
+class HncArrayProblem:
+    r"""HNC problem instance that is passed to the pseudoflow solver as arrays.
+
+    The closure package constructs the cut problem from a networkx graph, and the
+    pseudoflow package walks this graph to build the input of its C library. This
+    class builds the cut network directly with numpy and calls the C library without
+    any Python graph.
+
+    In the cut network of the closure package, each edge :math:`[i,j]` is represented
+    by the arcs :math:`(i,j)` and :math:`(j,i)` with capacity :math:`w_{ij}`. Positive
+    seeds are connected to the source and negative seeds are connected to the sink with
+    infinite capacity. Each other node :math:`i` is connected to the source by an arc
+    with capacity :math:`\lambda d_i`, where :math:`d_i` is the degree of node
+    :math:`i` in the directed graph, i.e. twice its degree in the undirected graph.
+
+    The network is reduced before it is passed to the solver. The positive seeds are
+    contracted into the source and the negative seeds are contracted into the sink.
+    An edge between a seed and another node becomes an arc from the source or to the
+    sink, and parallel arcs are merged by adding their capacities. Edges between two
+    seeds and nodes without edges do not affect the cut and are dropped. The source
+    sets are mapped back to the nodes of the graph, with the positive seeds in the
+    source set and the dropped nodes in the sink set as in the closure package.
+
+    Attributes:
+        _arc_matrix (np.array): (M, 4) array with tail, head, capacity and capacity
+            multiplier of each arc in the reduced network.
+        _is_positive_seed (np.array): (N,) boolean array that marks the positive
+            seeds.
+        _nodes (np.array): Graph node of each node in the reduced network other than
+            the source and the sink.
+    """
+
+    _library = _load_hpf_library()
+
+    def __init__(
+        # pylint: disable=C0330
+        self,
+        num_nodes,
+        heads,
+        tails,
+        weights,
+        positive_seeds,
+        negative_seeds,
+    ):
+        """Initializes a HncArrayProblem object.
+
+        Args:
+            num_nodes (int): Number of nodes in the graph.
+            heads (np.array): (E,) array with the first node of each edge.
+            tails (np.array): (E,) array with the second node of each edge.
+            weights (np.array): (E,) array with the non-negative weight of each edge.
+            positive_seeds (np.array): Indices of the nodes that must be part of the
+                cluster.
+            negative_seeds (np.array): Indices of the nodes that must be part of the
+                complement.
+        """
+        heads = np.asarray(heads, dtype=np.intp)
+        tails = np.asarray(tails, dtype=np.intp)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        self._is_positive_seed = np.zeros(num_nodes, dtype=bool)
+        self._is_positive_seed[np.asarray(positive_seeds, dtype=np.intp)] = True
+        is_negative_seed = np.zeros(num_nodes, dtype=bool)
+        is_negative_seed[np.asarray(negative_seeds, dtype=np.intp)] = True
+        is_negative_seed &= ~self._is_positive_seed
+
+        degrees = 2 * (
+            np.bincount(heads, weights=weights, minlength=num_nodes)
+            + np.bincount(tails, weights=weights, minlength=num_nodes)
+        )
+
+        # Reduced network: source 0, the remaining nodes 1, .., K, and sink K + 1.
+        is_kept = (degrees > 0) & ~self._is_positive_seed & ~is_negative_seed
+        self._nodes = np.flatnonzero(is_kept)
+        source, sink = 0, len(self._nodes) + 1
+        reduced_index = np.full(num_nodes, -1, dtype=np.intp)
+        reduced_index[self._nodes] = np.arange(1, sink)
+        reduced_index[self._is_positive_seed] = source
+        reduced_index[is_negative_seed] = sink
+
+        # Parallel arcs from the source or to the sink are merged per node.
+        arc_tails = np.concatenate([reduced_index[heads], reduced_index[tails]])
+        arc_heads = np.concatenate([reduced_index[tails], reduced_index[heads]])
+        arc_weights = np.concatenate([weights, weights])
+        to_sink = np.bincount(
+            arc_tails[arc_heads == sink],
+            weights=arc_weights[arc_heads == sink],
+            minlength=sink + 1,
+        )
+        from_source = np.bincount(
+            arc_heads[arc_tails == source],
+            weights=arc_weights[arc_tails == source],
+            minlength=sink + 1,
+        )
+
+        is_internal = (arc_tails > source) & (arc_tails < sink)
+        is_internal &= (arc_heads > source) & (arc_heads < sink)
+        order = np.argsort(arc_tails[is_internal], kind="stable")
+        sink_nodes = np.flatnonzero(to_sink[1:sink] > 0) + 1
+        source_nodes = np.arange(1, sink)
+
+        arcs = [
+            np.column_stack(
+                [
+                    arc_tails[is_internal][order],
+                    arc_heads[is_internal][order],
+                    arc_weights[is_internal][order],
+                    np.zeros(len(order)),
+                ]
+            ),
+            np.column_stack(
+                [
+                    sink_nodes,
+                    np.full(len(sink_nodes), sink),
+                    to_sink[sink_nodes],
+                    np.zeros(len(sink_nodes)),
+                ]
+            ),
+            np.column_stack(
+                [
+                    np.full(len(source_nodes), source),
+                    source_nodes,
+                    from_source[source_nodes],
+                    degrees[self._nodes],
+                ]
+            ),
+        ]
+        self._arc_matrix = np.ascontiguousarray(np.concatenate(arcs), dtype=np.float64)
+
+    def solve(self, value):
+        """Solves the HNC problem for a single value of lambda.
+
+        Args:
+            value (float): Value of lambda.
+
+        Returns:
+            np.array: Sorted indices of the nodes in the source set.
+        """
+        source_sets, _ = self.solve_parametric(value, value)
+        return source_sets[0]
+
+    def solve_parametric(self, low, high):
+        """Solves the HNC problem for all values of lambda in a range.
+
+        Args:
+            low (float): Lower bound on lambda.
+            high (float): Upper bound on lambda.
+
+        Returns:
+            tuple: List of source sets and list of breakpoints. Each source set is an
+            array with the sorted indices of its nodes. The source set is optimal for
+            values of lambda up to the corresponding breakpoint.
+        """
+        num_breakpoints = c_int(0)
+        cuts = POINTER(c_int)()
+        breakpoints = POINTER(c_double)()
+
+        num_nodes = len(self._nodes) + 2
+        self._library.hpf_solve(
+            c_int(num_nodes),
+            c_int(len(self._arc_matrix)),
+            c_int(0),
+            c_int(num_nodes - 1),
+            self._arc_matrix.ctypes.data_as(POINTER(c_double)),
+            (c_double * 2)(low, high),
+            c_int(0),
+            byref(num_breakpoints),
+            byref(cuts),
+            byref(breakpoints),
+            (c_int * 5)(),
+            (c_double * 3)(),
+        )
+        num_breakpoints = num_breakpoints.value
+        cut_matrix = np.ctypeslib.as_array(cuts, shape=(num_breakpoints, num_nodes))
+        source_sets = []
+        for cut in cut_matrix:
+            is_source = self._is_positive_seed.copy()
+            is_source[self._nodes[cut[1:-1] == 1]] = True
+            source_sets.append(np.flatnonzero(is_source))
+        breakpoint_values = [breakpoints[i] for i in range(num_breakpoints)]
+
+        self._library.libfree(breakpoints)
+        self._library.libfree(cuts)
+        return source_sets, breakpoint_values
+
 
 class Segmentation:
     """A set of pixels identified by HNC as a potential cell footprint.
 
+    The footprint is stored as a boolean mask of its bounding box together with the
+    movie coordinates of the top left pixel of the bounding box. The set of pixel
+    coordinates is materialized on first access of `selection`.
+
     Attributes:
-        selection (set): Pixels in the spatial footprint. Each pixel is represented as
-            a tuple.
         weight (float): Upper bound on the lambda coefficient for which this
             segmentation is optimal.
+        _mask (np.array): Boolean mask of the pixels in the bounding box of the
+            footprint.
+        _offset (tuple): Movie coordinates of the top left pixel of the bounding box.
+        _selection (set or None): Cached set of pixel coordinates.
+        _size (int): Number of pixels in the footprint.
     """
 
     def __init__(self, selection, weight):
-        """Initializes a Segmentation object."""
-        self.selection = set(selection)
+        """Initializes a Segmentation object.
+
+        Args:
+            selection (iterable): Pixels in the spatial footprint. Each pixel is
+                represented as a tuple.
+            weight (float): Upper bound on the lambda coefficient for which this
+                segmentation is optimal.
+        """
         self.weight = weight
+        self._mask, self._offset, self._size, self._selection = None, None, 0, None
+        self.selection = selection
+
+    @classmethod
+    def from_mask(cls, mask, offset, weight):
+        """Initializes a Segmentation object from a boolean mask.
+
+        Args:
+            mask (np.array): Boolean mask of the footprint, e.g. over a patch.
+            offset (tuple): Movie coordinates of the top left pixel of the mask.
+            weight (float): Upper bound on the lambda coefficient for which this
+                segmentation is optimal.
+
+        Returns:
+            Segmentation: Segmentation with the pixels of the mask.
+        """
+        segmentation = cls((), weight)
+        segmentation._set_mask(np.asarray(mask, dtype=bool), offset)
+        return segmentation
+
+    @property
+    def selection(self):
+        """set: Pixels in the footprint. Each pixel is represented as a tuple."""
+        if self._selection is None:
+            self._selection = set(map(tuple, self.coordinates().tolist()))
+        return self._selection
+
+    @selection.setter
+    def selection(self, selection):
+        pixels = np.array(list(selection), dtype=np.intp)
+        if pixels.size == 0:
+            self._set_mask(np.zeros((0,), dtype=bool), (0,))
+        else:
+            pixels = pixels.reshape(len(pixels), -1)
+            offset = np.amin(pixels, axis=0)
+            mask = np.zeros(np.amax(pixels, axis=0) - offset + 1, dtype=bool)
+            mask[tuple((pixels - offset).T)] = True
+            self._set_mask(mask, tuple(offset.tolist()))
+
+    @property
+    def mask(self):
+        """np.array: Boolean mask of the bounding box of the footprint."""
+        return self._mask
+
+    @property
+    def offset(self):
+        """tuple: Movie coordinates of the top left pixel of the bounding box."""
+        return self._offset
+
+    @property
+    def size(self):
+        """int: Number of pixels in the footprint."""
+        return self._size
+
+    def coordinates(self):
+        """Provides the movie coordinates of the pixels in the footprint.
+
+        Returns:
+            np.array: (size, D) array with one pixel per row in row-major order.
+        """
+        return np.argwhere(self._mask) + np.array(self._offset, dtype=np.intp)
+
+    def intersection_size(self, other):
+        """Computes the number of pixels in both footprints.
+
+        Args:
+            other (Segmentation): Another segmentation.
+
+        Returns:
+            int: Number of common pixels.
+        """
+        # pylint: disable=W0212
+        if self._size == 0 or other._size == 0:
+            return 0
+
+        start = np.maximum(self._offset, other._offset)
+        stop = np.minimum(
+            np.add(self._offset, self._mask.shape),
+            np.add(other._offset, other._mask.shape),
+        )
+        if np.any(stop <= start):
+            return 0
+
+        window = [
+            tuple(slice(a - o, b - o) for a, b, o in zip(start, stop, offset))
+            for offset in (self._offset, other._offset)
+        ]
+        return int(np.count_nonzero(self._mask[window[0]] & other._mask[window[1]]))
+
+    def _set_mask(self, mask, offset):
+        """Stores the mask trimmed to the bounding box of the footprint."""
+        self._size = int(np.count_nonzero(mask))
+        self._selection = None
+
+        if self._size == 0:
+            self._mask = np.zeros((0,) * mask.ndim, dtype=bool)
+            self._offset = tuple(int(x) for x in offset)
+            return
+
+        box = []
+        for axis in range(mask.ndim):
+            other_axes = tuple(a for a in range(mask.ndim) if a != axis)
+            nonzero = np.flatnonzero(np.any(mask, axis=other_axes))
+            box.append(slice(nonzero[0], nonzero[-1] + 1))
+
+        self._mask = mask[tuple(box)].copy()
+        self._offset = tuple(int(x) + b.start for x, b in zip(offset, box))
+
+    def __getstate__(self):
+        """Returns the state without the cached selection."""
+        state = self.__dict__.copy()
+        state["_selection"] = None
+        return state
 
     def __eq__(self, other):
         """Compares two Segmentation objects."""
+        # pylint: disable=W0212
         if isinstance(other, Segmentation):
-            return (self.selection == other.selection) and (self.weight == other.weight)
+            same_pixels = self._size == other._size and (
+                self._size == 0
+                or (
+                    self._offset == other._offset
+                    and np.array_equal(self._mask, other._mask)
+                )
+            )
+            return same_pixels and (self.weight == other.weight)
 
         return False
 
@@ -149,7 +544,10 @@ class Segmentation:
 
         The Segmentation is decomposed into connected components by considering
         horizontal or vertical adjacent pixels as neighbors. The connected component
-        with the most positive seeds is selected.
+        with the most positive seeds is selected. Ties are broken in favor of the
+        component with the first pixel in row-major order.
+
+        Components are labeled on the bounding-box mask of the selection.
 
         Args:
             positive_seeds (set): Pixels that are contained in the
@@ -158,42 +556,195 @@ class Segmentation:
         Returns:
             Segmentation: A new Segmentation object with the same weight.
         """
+        if self.size == 0:
+            return Segmentation.from_mask(self.mask, self.offset, self.weight)
 
-        # get an arbitrary element from seeds to compute dimension
-        num_dims = len(next(iter(self.selection)))
-        neighbors = four_neighborhood(num_dims)
+        structure = generate_binary_structure(self.mask.ndim, 1)
+        labels, num_components = label(self.mask, structure=structure)
 
-        graph = nx.Graph()
-        graph.add_nodes_from(self.selection)
+        seeds = np.array(list(positive_seeds), dtype=np.intp)
+        seeds = seeds.reshape(-1, self.mask.ndim) - np.array(self.offset)
+        inside = np.all((seeds >= 0) & (seeds < self.mask.shape), axis=1)
+        seed_labels = labels[tuple(seeds[inside].T)]
 
-        for index, shift in product(self.selection, neighbors):
-            neighbor = tuple(map(lambda a, b: a + b, index, shift))
-            if neighbor in graph:
-                graph.add_edge(index, neighbor)
+        overlap = np.bincount(seed_labels, minlength=num_components + 1)
+        best_component = np.argmax(overlap[1:]) + 1
 
-        components = list(nx.connected_components(graph))
-
-        overlap = [len(c.intersection(positive_seeds)) for c in components]
-
-        best_component = components[np.argmax(overlap)]
-
-        return Segmentation(best_component, self.weight)
+        best_mask = labels == best_component
+        return Segmentation.from_mask(best_mask, self.offset, self.weight)
 
     def fill_holes(self, movie_pixel_shape):
         """Fills holes in the selection.
 
+        A hole is a region of pixels outside the selection that is not connected to
+        the movie boundary. Any such region lies within the bounding box of the
+        selection. Holes are therefore filled on the bounding box padded by a one-pixel
+        border, which gives the same result as filling holes over the full movie.
+
         Args:
-            movie_pixel_shape (tuple): Pixel resolution of the movie.
+            movie_pixel_shape (tuple): Pixel resolution of the movie. Not needed for
+                the bounding-box computation and kept for compatibility.
 
         Returns:
             Segmentation: A new Segmentation object with the same weight.
         """
-        mask = np.full(movie_pixel_shape, False, dtype=np.bool)
+        # pylint: disable=W0613
+        if self.size == 0:
+            return Segmentation.from_mask(self.mask, self.offset, self.weight)
+
+        padded_mask = np.pad(self.mask, 1, mode="constant", constant_values=False)
+        filled_mask = binary_fill_holes(padded_mask)
+
+        offset = tuple(x - 1 for x in self.offset)
+        return Segmentation.from_mask(filled_mask, offset, self.weight)
+
+
+def clean_segmentations(
+    # pylint: disable=C0330
+    segmentations,
+    positive_seeds,
+    movie_pixel_shape,
+    is_size_feasible=None,
+):
+    """Cleans a sequence of segmentations in a single batch.
+
+    Produces the same result as calling :meth:`Segmentation.clean` on each
+    segmentation. The parametric segmentations of a candidate are nested, so all of them
+    fit in the bounding box of the largest one. The masks are stacked into one array
+    over this bounding box, padded by a one-pixel border. The connected components of
+    all segmentations are labeled at once, the positive seeds are counted per component
+    with a single lookup, and holes are filled at once. Neighboring pixels in different
+    segmentations are not connected.
+
+    If `is_size_feasible` is provided, only segmentations that can reach a feasible
+    size after cleaning are cleaned. A cleaned segmentation contains the selected
+    component and lies within the bounding box of that component, since hole filling
+    does not extend beyond it. Segmentations are first screened with the bounding box
+    of the raw segmentation and then with the selected component. Holes are only
+    filled for the remaining segmentations.
+
+    Args:
+        segmentations (list[Segmentation]): Segmentations to clean.
+        positive_seeds (set): Pixels that are contained in the spatial footprint. Each
+            pixel is represented by a tuple.
+        movie_pixel_shape (tuple): Pixel resolution of the movie.
+        is_size_feasible (function or None): Function that takes a lower and an upper
+            bound on the size of a cleaned segmentation and returns whether a size in
+            this range is acceptable, see :meth:`~.SizePostprocessor.is_size_feasible`.
+            All segmentations are cleaned if None.
+
+    Returns:
+        list[Segmentation]: Cleaned segmentations in the same order. Segmentations
+        that cannot reach a feasible size are omitted.
+    """
+    if is_size_feasible is not None:
+        segmentations = [
+            s for s in segmentations if is_size_feasible(min(s.size, 1), s.mask.size)
+        ]
+
+    nonempty = [s for s in segmentations if s.size > 0]
+    if not nonempty:
+        return [s.clean(positive_seeds, movie_pixel_shape) for s in segmentations]
+
+    num_dims = nonempty[0].mask.ndim
+    start = np.amin([s.offset for s in nonempty], axis=0)
+    stop = np.amax([np.add(s.offset, s.mask.shape) for s in nonempty], axis=0)
+
+    masks = np.zeros((len(segmentations),) + tuple(stop - start + 2), dtype=bool)
+    for index, segmentation in enumerate(segmentations):
+        if segmentation.size > 0:
+            corner = np.subtract(segmentation.offset, start) + 1
+            window = tuple(
+                slice(c, c + n) for c, n in zip(corner, segmentation.mask.shape)
+            )
+            masks[(index,) + window] = segmentation.mask
+
+    # 4-neighborhood within each segmentation, no connections between segmentations.
+    structure = np.zeros((3,) * (num_dims + 1), dtype=bool)
+    structure[1] = generate_binary_structure(num_dims, 1)
+    labels, num_labels = label(masks, structure=structure)
+
+    best_label = _select_max_seed_labels(labels, num_labels, positive_seeds, start - 1)
+
+    if is_size_feasible is not None:
+        keep = [
+            index
+            for index, bounds in enumerate(_component_size_bounds(labels, best_label))
+            if is_size_feasible(*bounds)
+        ]
+        segmentations = [segmentations[index] for index in keep]
+        labels, best_label = labels[keep], best_label[keep]
+
+    best_masks = labels == best_label.reshape((-1,) + (1,) * num_dims)
+    best_masks &= labels > 0
+    filled_masks = binary_fill_holes(best_masks, structure=structure)
 
-        indices = tuple(zip(*self.selection))
-        mask[indices] = True
+    return [
+        Segmentation.from_mask(mask, start - 1, segmentation.weight)
+        for mask, segmentation in zip(filled_masks, segmentations)
+    ]
 
-        filled_mask = binary_fill_holes(mask)
 
-        index_arrays = [a.tolist() for a in np.where(filled_mask)]
-        return Segmentation(set(zip(*index_arrays)), self.weight)
+def _select_max_seed_labels(labels, num_labels, positive_seeds, offset):
+    """Selects per segmentation the label of the component with the most seeds.
+
+    Ties are broken in favor of the lowest label, i.e. the first component in row-major
+    order.
+
+    Args:
+        labels (np.array): (K, N_1, N_2, ..) array with the component labels of K
+            stacked segmentations.
+        num_labels (int): Number of components.
+        positive_seeds (set): Movie coordinates of the positive seeds.
+        offset (tuple): Movie coordinates of pixel (0, 0, ..) of each segmentation.
+
+    Returns:
+        np.array: (K,) array with the selected label per segmentation. Zero for a
+        segmentation without components.
+    """
+    num_segmentations, num_dims = labels.shape[0], labels.ndim - 1
+
+    seeds = np.array(list(positive_seeds), dtype=np.intp)
+    seeds = seeds.reshape(-1, num_dims) - offset
+    inside = np.all((seeds >= 0) & (seeds < labels.shape[1:]), axis=1)
+    seed_labels = labels[(slice(None),) + tuple(seeds[inside].T)]
+    overlap = np.bincount(seed_labels.ravel(), minlength=num_labels + 1)
+
+    level = np.zeros(num_labels + 1, dtype=np.intp)
+    level[labels.reshape(num_segmentations, -1)] = np.arange(
+        num_segmentations
+    ).reshape(-1, 1)
+
+    component_labels = np.arange(1, num_labels + 1)
+    order = np.lexsort((component_labels, -overlap[1:], level[1:]))
+    levels, first = np.unique(level[1:][order], return_index=True)
+    best_label = np.zeros(num_segmentations, dtype=np.intp)
+    best_label[levels] = component_labels[order][first]
+    return best_label
+
+
+def _component_size_bounds(labels, selected_labels):
+    """Bounds the size of each selected component after filling its holes.
+
+    Args:
+        labels (np.array): (K, N_1, N_2, ..) array with the component labels of K
+            stacked segmentations.
+        selected_labels (np.array): (K,) array with the selected label per
+            segmentation. Zero if no component is selected.
+
+    Returns:
+        list[tuple]: Lower and upper bound per segmentation. The lower bound is the
+        size of the component and the upper bound is the size of its bounding box.
+    """
+    component_sizes = np.bincount(labels.ravel())
+    component_boxes = find_objects(labels)
+
+    bounds = []
+    for selected in selected_labels:
+        if selected == 0:
+            bounds.append((0, 0))
+        else:
+            box = component_boxes[selected - 1][1:]
+            box_size = int(np.product([b.stop - b.start for b in box]))
+            bounds.append((int(component_sizes[selected]), box_size))
+    return bounds
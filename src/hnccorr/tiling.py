@@ -0,0 +1,256 @@
+# Copyright © 2017. Regents of the University of California (Regents). All Rights
+# Reserved.
+#
+# Permission to use, copy, modify, and distribute this software and its documentation
+# for educational, research, and not-for-profit purposes, without fee and without a
+# signed licensing agreement, is hereby granted, provided that the above copyright
+# notice, this paragraph and the following two paragraphs appear in all copies,
+# modifications, and distributions. Contact The Office of Technology Licensing, UC
+# Berkeley, 2150 Shattuck Avenue, Suite 510, Berkeley, CA 94720-1620, (510) 643-7201,
+# for commercial licensing opportunities. Created by Quico Spaen, Roberto Asín-Achá,
+# and Dorit S. Hochbaum, Department of Industrial Engineering and Operations Research,
+# University of California, Berkeley.
+#
+# IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+# INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF THE USE
+# OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+# SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED "AS
+# IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+# ENHANCEMENTS, OR MODIFICATIONS.
+"""Components for segmenting a movie in spatial tiles."""
+
+from collections import defaultdict
+from itertools import product
+import math
+
+import numpy as np
+
+from hnccorr.segmentation import Segmentation
+from hnccorr.utils import add_offset_to_coordinate
+
+
+class Tile:
+    """Spatial tile of a movie.
+
+    The cores of the tiles partition the field of view. Each tile is segmented over its
+    region, which is the core padded by a halo on each side. The region is clipped at
+    the movie boundaries.
+
+    Attributes:
+        core (tuple[slice]): Pixels owned by the tile. One slice per dimension.
+        index (int): Position of the tile in the tiling.
+        region (tuple[slice]): Pixels segmented for the tile. One slice per dimension.
+    """
+
+    def __init__(self, index, core, region):
+        """Initializes a Tile object."""
+        self.index = index
+        self.core = tuple(core)
+        self.region = tuple(region)
+
+    @property
+    def offset(self):
+        """Movie coordinates of the top left pixel of the region."""
+        return tuple(s.start for s in self.region)
+
+    def owns(self, pixel):
+        """Determines whether a pixel lies in the core of the tile."""
+        return all(s.start <= x < s.stop for x, s in zip(pixel, self.core))
+
+    def __eq__(self, other):
+        """Compares Tile objects."""
+        if isinstance(other, Tile):
+            return (self.index, self.core, self.region) == (
+                other.index,
+                other.core,
+                other.region,
+            )
+        return False
+
+    def __repr__(self):
+        """Representation of the tile with its index, core and region."""
+        return "Tile(%d, core=%s, region=%s)" % (self.index, self.core, self.region)
+
+
+class TiledHNCcorr:
+    """Segments a movie tile by tile with HNCcorr.
+
+    The field of view is split into tiles. Each tile is segmented independently over
+    its region, which is padded by a halo of at least `patch_size` pixels, such that
+    cells near the core boundary are segmented with the same patches as in an untiled
+    run. Seeding also runs per tile, so memory scales with the tile size instead of the
+    field of view.
+
+    A cell belongs to the tile whose core contains the centroid of its footprint.
+    Cells that are found by multiple tiles, e.g. with centroids on either side of a core
+    boundary, are merged: a cell is discarded if its footprint overlaps a cell of
+    another tile that is kept earlier with an intersection over union of at least
+    `overlap_threshold`.
+
+    Tiles are independent. For distributed runs, call :meth:`segment_tile` for each
+    tile on separate machines, e.g. with a memory-mapped movie on a shared file
+    system, and combine the results with :meth:`merge`.
+
+    Attributes:
+        halo (int): Padding in pixels of the region of each tile.
+        overlap_threshold (float): Intersection over union above which cells of
+            different tiles are considered duplicates.
+        segmentations (list[Segmentation]): Merged segmentations of the movie in movie
+            coordinates.
+        tile_size (int): Size in pixels of the core of a tile in each dimension.
+        _hnccorr (HNCcorr): HNCcorr object used to segment each tile.
+    """
+
+    def __init__(self, hnccorr, tile_size, halo=None, overlap_threshold=0.5):
+        """Initializes a TiledHNCcorr object.
+
+        Args:
+            hnccorr (HNCcorr): HNCcorr object used to segment each tile.
+            tile_size (int): Size in pixels of the core of a tile in each dimension.
+            halo (int or None): Padding in pixels of the region of each tile. Defaults
+                to the patch size of `hnccorr`.
+            overlap_threshold (float): Intersection over union above which cells of
+                different tiles are considered duplicates.
+
+        Raises:
+            ValueError: If the halo is smaller than the patch size.
+        """
+        if halo is None:
+            halo = hnccorr.patch_size
+        if halo < hnccorr.patch_size:
+            raise ValueError(
+                "halo (%d) should be at least the patch size (%d)."
+                % (halo, hnccorr.patch_size)
+            )
+
+        self._hnccorr = hnccorr
+        self.tile_size = tile_size
+        self.halo = halo
+        self.overlap_threshold = overlap_threshold
+        self.segmentations = []
+
+    def tiles(self, pixel_shape):
+        """Splits the field of view into tiles.
+
+        Args:
+            pixel_shape (tuple): Resolution of the movie in pixels.
+
+        Returns:
+            list[Tile]: Tiles in row-major order.
+        """
+        starts = [range(0, n, self.tile_size) for n in pixel_shape]
+
+        tiles = []
+        for index, corner in enumerate(product(*starts)):
+            core = [
+                slice(start, min(start + self.tile_size, n))
+                for start, n in zip(corner, pixel_shape)
+            ]
+            region = [
+                slice(max(s.start - self.halo, 0), min(s.stop + self.halo, n))
+                for s, n in zip(core, pixel_shape)
+            ]
+            tiles.append(Tile(index, core, region))
+        return tiles
+
+    def segment_tile(self, movie, tile):
+        """Segments the cells of a single tile.
+
+        Args:
+            movie (Movie): Calcium imaging movie.
+            tile (Tile): Tile to segment.
+
+        Returns:
+            list[Segmentation]: Segmentations in movie coordinates of the cells whose
+            centroid lies in the core of the tile.
+        """
+        name = "%s_tile%d" % (movie.name, tile.index)
+        self._hnccorr.segment(movie.crop(tile.region, name=name))
+
+        segmentations = []
+        for segmentation in self._hnccorr.segmentations:
+            segmentation = Segmentation.from_mask(
+                segmentation.mask,
+                add_offset_to_coordinate(segmentation.offset, tile.offset),
+                segmentation.weight,
+            )
+            if tile.owns(self._centroid(segmentation)):
+                segmentations.append(segmentation)
+        return segmentations
+
+    def merge(self, tile_segmentations):
+        """Merges the segmentations of the tiles and removes duplicate cells.
+
+        Cells are processed in the order of the tiles. A cell is discarded if it
+        overlaps a kept cell of another tile with an intersection over union of at
+        least `overlap_threshold`.
+
+        Args:
+            tile_segmentations (list[list[Segmentation]]): Segmentations of each tile
+                as returned by :meth:`segment_tile`, ordered by tile.
+
+        Returns:
+            list[Segmentation]: Merged segmentations.
+        """
+        merged = []
+        tile_of_cell = []
+        cells_of_pixel = defaultdict(list)
+
+        for tile_index, segmentations in enumerate(tile_segmentations):
+            for segmentation in segmentations:
+                overlaps = defaultdict(int)
+                for pixel in segmentation.selection:
+                    for cell in cells_of_pixel.get(pixel, ()):
+                        overlaps[cell] += 1
+
+                size = segmentation.size
+                if any(
+                    tile_of_cell[cell] != tile_index
+                    and self._is_duplicate(overlap, size, merged[cell].size)
+                    for cell, overlap in overlaps.items()
+                ):
+                    continue
+
+                for pixel in segmentation.selection:
+                    cells_of_pixel[pixel].append(len(merged))
+                merged.append(segmentation)
+                tile_of_cell.append(tile_index)
+
+        return merged
+
+    def segment(self, movie):
+        """Segments the movie tile by tile and merges the results.
+
+        Identified cells are accessible through the `segmentations` attribute.
+
+        Args:
+            movie (Movie): Calcium imaging movie.
+
+        Returns:
+            Reference to itself.
+        """
+        self.segmentations = self.merge(
+            [self.segment_tile(movie, tile) for tile in self.tiles(movie.pixel_shape)]
+        )
+        return self
+
+    def segmentations_to_list(self):
+        """Exports segmentations to a list of dictionaries.
+
+        See :meth:`~.HNCcorr.segmentations_to_list`.
+        """
+        return [{"coordinates": list(s.selection)} for s in self.segmentations]
+
+    def _is_duplicate(self, overlap, size1, size2):
+        """Determines whether two footprints with a given overlap are duplicates."""
+        return overlap / float(size1 + size2 - overlap) >= self.overlap_threshold
+
+    @staticmethod
+    def _centroid(segmentation):
+        """Computes the pixel that contains the centroid of a footprint."""
+        mean = np.mean(segmentation.coordinates(), axis=0)
+        return tuple(int(math.floor(x)) for x in mean)
@@ -25,8 +25,11 @@
 
 import glob
 import os
+from contextlib import contextmanager
 from itertools import product
 
+import numpy as np
+
 
 def add_offset_set_coordinates(iterable, offset):
     """Adds a fixed offset to all pixel coordinates in a set.
@@ -172,3 +175,28 @@ def generate_pixels(shape):
             [(0, 0), (0, 1), (1, 0), (1, 1)]
     """
     return product(*[range(n) for n in shape])
+
+
+@contextmanager
+def fixed_random_state(seed):
+    """Temporarily seeds the global random number generator of numpy.
+
+    Components that rely on the global random number generator, such as the default
+    dimension reducer of sparse computation, give reproducible results within the
+    context. The state of the generator is restored afterwards.
+
+    Args:
+        seed (int or list[int]): Seed of the random number generator.
+
+    Example:
+        .. code-block:: python
+
+            >>> with fixed_random_state([3, 5]):
+            ...     np.random.rand()
+    """
+    state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        yield
+    finally:
+        np.random.set_state(state)
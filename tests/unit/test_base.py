@@ -21,10 +21,26 @@
 # SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED "AS
 # IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
 # ENHANCEMENTS, OR MODIFICATIONS.
+import pickle
 import pytest
-from copy import deepcopy
-
-from hnccorr.base import HNCcorr, Candidate, HNCcorrConfig, DEFAULT_CONFIG
+import numpy as np
+from copy import copy, deepcopy
+
+from hnccorr.base import (
+    HNCcorr,
+    Candidate,
+    HNCcorrConfig,
+    DEFAULT_CONFIG,
+    _initialize_worker,
+    _segment_candidate,
+)
+from hnccorr.cache import PatchCache
+from hnccorr.graph import (
+    CorrelationEmbedding,
+    IncrementalCorrelationEmbedding,
+    select_uncorrelated_pixels,
+)
+from hnccorr.movie import Movie
 from hnccorr.segmentation import Segmentation
 
 
@@ -94,6 +110,7 @@ def mock_graph_constructor(mocker, dummy):
 @pytest.fixture
 def mock_patch_class(mocker, dummy):
     patch_class = mocker.patch("hnccorr.movie.Patch", autospec=True)
+    patch_class.return_value.coordinate_offset = (0, 0)
     return patch_class
 
 
@@ -108,6 +125,13 @@ def mock_segmentation_class(mocker):
     return mocker.patch("hnccorr.segmentation.Segmentation", autospec=True)
 
 
+@pytest.fixture
+def mock_clean_segmentations(mocker):
+    return mocker.patch(
+        "hnccorr.base.clean_segmentations", return_value=["clean", "clean"]
+    )
+
+
 @pytest.fixture
 def H(
     dummy,
@@ -173,14 +197,13 @@ class TestCandidate:
         mock_patch_class,
         mock_embedding_class,
         mock_segmentation_class,
+        mock_clean_segmentations,
     ):
         mock_pos_seed_selector.select.return_value = "positive_seed"
         mock_neg_seed_selector.select.return_value = "negative_seed"
         mock_embedding_class.return_value = "embedding_class"
         mock_postprocessor.select.return_value = "best segmentation"
         mock_graph_constructor.construct.return_value = "graph"
-        mock_patch_class.return_value = "patch"
-        mock_segmentation_class.return_value.clean.return_value = "clean"
 
         center_seed = 1
         mock_segmentor.solve.return_value = [
@@ -202,8 +225,68 @@ class TestCandidate:
             mock_pos_seed_selector.select.return_value,
             mock_neg_seed_selector.select.return_value,
         )
+        mock_clean_segmentations.assert_called_once_with(
+            mock_segmentor.solve.return_value,
+            mock_pos_seed_selector.select.return_value,
+            mock_movie.pixel_shape,
+            mock_postprocessor.is_size_feasible,
+        )
         mock_postprocessor.select.assert_called_once_with(["clean", "clean"])
 
+    def test_candidate_segment_correlation_threshold(
+        self,
+        hnccorr,
+        mock_pos_seed_selector,
+        mock_neg_seed_selector,
+        mock_segmentor,
+        mock_graph_constructor,
+        mock_patch_class,
+        mock_embedding_class,
+        mock_clean_segmentations,
+        mocker,
+    ):
+        select_pixels = mocker.patch(
+            "hnccorr.base.select_uncorrelated_pixels", return_value={(5,), (6,)}
+        )
+        mock_neg_seed_selector.select.return_value = {(1,), (5,)}
+        hnccorr.correlation_threshold = 0.2
+
+        Candidate(1, hnccorr).segment()
+
+        select_pixels.assert_called_once_with(
+            mock_patch_class.return_value,
+            mock_embedding_class.return_value,
+            mock_pos_seed_selector.select.return_value,
+            0.2,
+        )
+        mock_graph_constructor.construct.assert_called_once_with(
+            mock_patch_class.return_value, mock_embedding_class.return_value
+        )
+        mock_segmentor.solve.assert_called_once_with(
+            mock_graph_constructor.construct.return_value,
+            mock_pos_seed_selector.select.return_value,
+            {(1,), (5,), (6,)},
+        )
+
+    def test_candidate_segment_patch_cache(
+        self,
+        hnccorr,
+        mock_graph_constructor,
+        mock_patch_class,
+        mock_embedding_class,
+        mock_clean_segmentations,
+    ):
+        mock_patch_class.compute_coordinate_offset.return_value = (0, 0)
+        hnccorr.patch_cache = PatchCache(100)
+
+        Candidate(1, hnccorr).segment()
+        Candidate(2, hnccorr).segment()
+
+        mock_patch_class.assert_called_once()
+        mock_embedding_class.assert_called_once()
+        mock_graph_constructor.construct.assert_called_once()
+        assert (hnccorr.patch_cache.hits, hnccorr.patch_cache.misses) == (1, 1)
+
     def test_candidate_equality(self):
         assert Candidate(1, "a") == Candidate(1, "a")
         assert Candidate(1, "a") != Candidate(2, "a")
@@ -226,13 +309,17 @@ class TestCandidate:
         assert Candidate(1, "a").center_seed == 1
 
     def test_candidate_clean_segmentations(
-        self, dummy, mock_segmentor, mock_segmentation_class, hnccorr
+        self,
+        dummy,
+        mock_segmentor,
+        mock_segmentation_class,
+        hnccorr,
+        mock_clean_segmentations,
     ):
         mock_segmentor.solve.return_value = [
             mock_segmentation_class(dummy, dummy),
             mock_segmentation_class(dummy, dummy),
         ]
-        mock_segmentation_class.return_value.clean.return_value = "clean"
 
         c = Candidate(1, hnccorr)
         assert c.clean_segmentations is None
@@ -246,6 +333,27 @@ class TestCandidate:
         assert c.best_segmentation == mock_postprocessor.select.return_value
 
 
+@pytest.fixture
+def cell_movie():
+    generator = np.random.RandomState(0)
+    data = generator.randn(60, 24, 24) + 10
+    for row, column in [(6, 6), (7, 15), (16, 10), (17, 18)]:
+        rows, columns = slice(row - 2, row + 2), slice(column - 2, column + 2)
+        data[:, rows, columns] += 3 * generator.rand(60, 1, 1)
+    return Movie("cells", data)
+
+
+SMALL_CONFIG = dict(
+    patch_size=15,
+    negative_seed_circle_radius=4,
+    postprocessor_min_cell_size=4,
+    postprocessor_preferred_cell_size=16,
+    postprocessor_max_cell_size=40,
+    seeder_exclusion_padding=1,
+    percentage_of_seeds=0.5,
+)
+
+
 class TestHNCcorr:
     def test_hnccorr_seeder(self, H, seeder_fixed_val):
         assert H.seeder == seeder_fixed_val
@@ -259,6 +367,42 @@ class TestHNCcorr:
     def test_hnccorr_from_non_default_config(self):
         assert isinstance(HNCcorr.from_config(HNCcorrConfig()), HNCcorr)
 
+    def test_hnccorr_from_config_stores_config(self):
+        H = HNCcorr.from_config(HNCcorrConfig(patch_size=21))
+
+        assert H.config.patch_size == 21
+        assert H.config.seeder_mask_size == DEFAULT_CONFIG.seeder_mask_size
+        assert HNCcorr.from_config(H.config).patch_size == 21
+
+    def test_hnccorr_from_config_patch_cache(self):
+        H = HNCcorr.from_config(HNCcorrConfig(patch_cache_size=2))
+
+        assert H.patch_cache._max_bytes == 2 * 2 ** 20
+        assert HNCcorr.from_config().patch_cache is None
+
+    def test_hnccorr_from_config_incremental_embedding(self):
+        H = HNCcorr.from_config(HNCcorrConfig(incremental_correlation_embedding=True))
+
+        assert isinstance(H.embedding_class, IncrementalCorrelationEmbedding)
+        assert HNCcorr.from_config().embedding_class is CorrelationEmbedding
+
+    def test_hnccorr_from_config_correlation_threshold(self):
+        H = HNCcorr.from_config(HNCcorrConfig(negative_seed_correlation_threshold=0.1))
+
+        assert H.correlation_threshold == 0.1
+        assert HNCcorr.from_config().correlation_threshold is None
+
+    def test_hnccorr_from_config_is_picklable(self):
+        H = HNCcorr.from_config(HNCcorrConfig(gaussian_similarity_alpha=0.5))
+
+        data = pickle.dumps(H)
+        unpickled = pickle.loads(data)
+
+        assert len(data) < 2000
+        assert unpickled.config.gaussian_similarity_alpha == 0.5
+        assert unpickled.graph_constructor._weight_function._alpha == 0.5
+        assert vars(unpickled.segmentor) == vars(H.segmentor)
+
     def test_hnccorr_movie(self, H, MM, seeder_fixed_val):
         seeder_fixed_val.called = True  # deactive seeder
 
@@ -340,7 +484,7 @@ class TestHNCcorr:
     ):
         mock_seeder.next.side_effect = ("seed1", None)
         mock_candidate_class.return_value.segment.return_value = Segmentation(
-            {"pixel"}, 1
+            {(2, 3)}, 1
         )
         H = HNCcorr(
             mock_seeder,
@@ -357,7 +501,93 @@ class TestHNCcorr:
 
         H.segment(dummy)
 
-        mock_seeder.exclude_pixels.assert_called_once_with({"pixel"})
+        mock_seeder.exclude_pixels.assert_called_once_with({(2, 3)})
+
+    def test_hnccorr_segment_is_reproducible(self, cell_movie):
+        H = HNCcorr.from_config(HNCcorrConfig(**SMALL_CONFIG))
+        first = [s.selection for s in H.segment(cell_movie).segmentations]
+        np.random.seed(1)
+        second = [s.selection for s in H.segment(cell_movie).segmentations]
+
+        assert first == second
+
+    def test_hnccorr_segment_low_correlation_threshold(self, cell_movie):
+        H = HNCcorr.from_config(HNCcorrConfig(**SMALL_CONFIG))
+        expected = [s.selection for s in H.segment(cell_movie).segmentations]
+        H = HNCcorr.from_config(
+            HNCcorrConfig(negative_seed_correlation_threshold=-1.1, **SMALL_CONFIG)
+        )
+
+        assert [s.selection for s in H.segment(cell_movie).segmentations] == expected
+
+    def test_hnccorr_segment_correlation_threshold(self, cell_movie, mocker):
+        H = HNCcorr.from_config(
+            HNCcorrConfig(negative_seed_correlation_threshold=0.3, **SMALL_CONFIG)
+        )
+        added, segmentations = [], []
+
+        def select(patch, embedding, pos_seeds, threshold):
+            pixels = select_uncorrelated_pixels(patch, embedding, pos_seeds, threshold)
+            added.append((pos_seeds, pixels))
+            return pixels
+
+        def solve(graph, pos_seeds, neg_seeds, solve=H.segmentor.solve):
+            segmentations.append(solve(graph, pos_seeds, neg_seeds))
+            return segmentations[-1]
+
+        mocker.patch("hnccorr.base.select_uncorrelated_pixels", side_effect=select)
+        H.segmentor.solve = solve
+        H.segment(cell_movie)
+
+        assert H.segmentations
+        assert len(added) == len(segmentations)
+        assert all(pixels for _, pixels in added)
+        for (pos_seeds, pixels), candidate_segmentations in zip(added, segmentations):
+            assert not pixels & pos_seeds
+            for segmentation in candidate_segmentations:
+                assert not pixels & segmentation.selection
+
+    def test_hnccorr_parallel_segment_incremental_embedding(self, cell_movie):
+        H = HNCcorr.from_config(
+            HNCcorrConfig(incremental_correlation_embedding=True, **SMALL_CONFIG)
+        )
+
+        with pytest.raises(ValueError):
+            H.segment(cell_movie, num_workers=2)
+        assert H.segment(cell_movie).segmentations
+
+    @pytest.mark.parametrize("patch_cache_size", [0, 16])
+    def test_hnccorr_parallel_segment_matches_serial(
+        self, cell_movie, patch_cache_size
+    ):
+        H = HNCcorr.from_config(
+            HNCcorrConfig(patch_cache_size=patch_cache_size, **SMALL_CONFIG)
+        )
+        serial = [s.selection for s in H.segment(cell_movie).segmentations]
+        serial_seeds = [c.center_seed for c in H.candidates]
+
+        H.segment(cell_movie, num_workers=2)
+
+        assert len(serial) > 0
+        assert [s.selection for s in H.segmentations] == serial
+        assert [c.center_seed for c in H.candidates] == serial_seeds
+        assert all(c._hnccorr is H for c in H.candidates)
+
+    def test_candidate_copy_keeps_hnccorr(self, hnccorr):
+        c = Candidate((1,), hnccorr)
+
+        assert copy(c)._hnccorr is hnccorr
+
+    def test_segment_candidate_excludes_hnccorr(
+        self, hnccorr, mock_graph_constructor, mock_clean_segmentations
+    ):
+        _initialize_worker(hnccorr)
+
+        candidate = _segment_candidate((1,))
+
+        assert candidate._hnccorr is None
+        assert candidate.center_seed == (1,)
+        assert candidate.best_segmentation is not None
 
     def test_segmentations_to_list(self, H, dummy, mock_segmentation_class):
         # selections are stored as lists to fix order.
@@ -411,6 +641,7 @@ class TestHnccorrConfig:
         assert DEFAULT_CONFIG.seeder_mask_size == 3
         assert DEFAULT_CONFIG.seeder_exclusion_padding == 4
         assert DEFAULT_CONFIG.seeder_grid_size == 5
+        assert DEFAULT_CONFIG.seeder_cache_dir is None
         assert DEFAULT_CONFIG.percentage_of_seeds == pytest.approx(0.4)
         assert DEFAULT_CONFIG.postprocessor_min_cell_size == 40
         assert DEFAULT_CONFIG.postprocessor_max_cell_size == 200
@@ -0,0 +1,110 @@
+# Copyright © 2017. Regents of the University of California (Regents). All Rights
+# Reserved.
+#
+# Permission to use, copy, modify, and distribute this software and its documentation
+# for educational, research, and not-for-profit purposes, without fee and without a
+# signed licensing agreement, is hereby granted, provided that the above copyright
+# notice, this paragraph and the following two paragraphs appear in all copies,
+# modifications, and distributions. Contact The Office of Technology Licensing, UC
+# Berkeley, 2150 Shattuck Avenue, Suite 510, Berkeley, CA 94720-1620, (510) 643-7201,
+# for commercial licensing opportunities. Created by Quico Spaen, Roberto Asín-Achá,
+# and Dorit S. Hochbaum, Department of Industrial Engineering and Operations Research,
+# University of California, Berkeley.
+#
+# IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+# INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF THE USE
+# OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+# SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED "AS
+# IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+# ENHANCEMENTS, OR MODIFICATIONS.
+import pickle
+import pytest
+import numpy as np
+
+from hnccorr.cache import PatchCache
+
+
+class FakePatch:
+    def __init__(self, coordinate_offset):
+        self.coordinate_offset = coordinate_offset
+
+
+class FakeEmbedding:
+    def __init__(self, num_bytes):
+        self.embedding = np.zeros(num_bytes, dtype=np.uint8)
+        self.name = "embedding"
+
+
+@pytest.fixture
+def cache():
+    return PatchCache(100)
+
+
+class TestPatchCache:
+    def test_patch_cache_miss(self, cache):
+        assert cache.get((0, 0)) is None
+        assert (cache.hits, cache.misses) == (0, 1)
+
+    def test_patch_cache_hit(self, cache):
+        patch, embedding = FakePatch([0, 1]), FakeEmbedding(10)
+        cache.put(patch, embedding, "graph")
+
+        assert cache.get((0, 1)) == (patch, embedding, "graph")
+        assert (cache.hits, cache.misses) == (1, 0)
+        assert len(cache) == 1
+        assert cache.num_bytes == 10
+
+    def test_patch_cache_counts_patch_data(self, cache):
+        patch = FakePatch([0, 1])
+        patch.data = np.zeros(20, dtype=np.uint8)
+        cache.put(patch, FakeEmbedding(10), "graph")
+
+        assert cache.num_bytes == 30
+
+    def test_patch_cache_evicts_least_recently_used(self, cache):
+        for i in range(3):
+            cache.put(FakePatch((i,)), FakeEmbedding(40), "graph")
+        cache.get((1,))
+        cache.put(FakePatch((3,)), FakeEmbedding(40), "graph")
+
+        assert cache.get((0,)) is None
+        assert cache.get((1,)) is not None
+        assert cache.get((2,)) is None
+        assert cache.get((3,)) is not None
+        assert cache.num_bytes == 80
+
+    def test_patch_cache_skips_large_entry(self, cache):
+        cache.put(FakePatch((0,)), FakeEmbedding(40), "graph")
+        cache.put(FakePatch((1,)), FakeEmbedding(101), "graph")
+
+        assert len(cache) == 1
+        assert cache.get((1,)) is None
+
+    def test_patch_cache_replaces_entry(self, cache):
+        cache.put(FakePatch((0,)), FakeEmbedding(40), "graph")
+        cache.put(FakePatch((0,)), FakeEmbedding(30), "graph")
+
+        assert len(cache) == 1
+        assert cache.num_bytes == 30
+
+    def test_patch_cache_clear(self, cache):
+        cache.put(FakePatch((0,)), FakeEmbedding(40), "graph")
+        cache.get((0,))
+        cache.clear()
+
+        assert len(cache) == 0
+        assert cache.num_bytes == 0
+        assert (cache.hits, cache.misses) == (0, 0)
+
+    def test_patch_cache_pickle(self, cache):
+        cache.put(FakePatch((0,)), FakeEmbedding(40), "graph")
+
+        unpickled = pickle.loads(pickle.dumps(cache))
+
+        assert len(unpickled) == 0
+        assert unpickled.num_bytes == 0
+        assert unpickled._max_bytes == 100
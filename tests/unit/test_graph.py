@@ -21,12 +21,22 @@
 # SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED "AS
 # IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
 # ENHANCEMENTS, OR MODIFICATIONS.
+import pickle
+import weakref
 import pytest
 import numpy as np
+from hnccorr.movie import Movie, Patch
 from hnccorr.graph import (
     CorrelationEmbedding,
     exponential_distance_decay,
+    ExponentialDistanceDecay,
     GraphConstructor,
+    IncrementalCorrelationEmbedding,
+    LowRankCorrelationEmbedding,
+    normalize_pixels,
+    PairwiseWeightFunction,
+    select_uncorrelated_pixels,
+    SimilarityGraph,
     SparseComputationEmbeddingWrapper,
 )
 
@@ -69,6 +79,50 @@ def CE2(mock_patch):
     return CorrelationEmbedding(mock_patch)
 
 
+def test_normalize_pixels():
+    data = np.random.RandomState(0).rand(10, 4)
+    data[:, 2] = 0.1
+
+    normalized = normalize_pixels(data)
+
+    assert normalized.dtype == np.float32
+    np.testing.assert_allclose(
+        np.dot(normalized[:, [0, 1, 3]].T, normalized[:, [0, 1, 3]]),
+        np.corrcoef(data[:, [0, 1, 3]].T),
+        rtol=1e-5,
+    )
+    np.testing.assert_equal(normalized[:, 2], 0)
+
+
+def test_select_uncorrelated_pixels(mock_patch, CE1):
+    mock_patch.coordinate_offset = (10,)
+
+    assert select_uncorrelated_pixels(mock_patch, CE1, {(13,)}, 0.5) == set()
+    assert select_uncorrelated_pixels(mock_patch, CE1, {(13,)}, 1.1) == {
+        (10,),
+        (11,),
+        (12,),
+        (14,),
+        (15,),
+        (16,),
+    }
+    assert select_uncorrelated_pixels(mock_patch, CE1, {(20,)}, 1.1) == set()
+
+
+def test_select_uncorrelated_pixels_average_of_seeds(mock_patch):
+    mock_patch.pixel_shape = (2, 2)
+    mock_patch.coordinate_offset = (3, 5)
+    mock_patch.__getitem__.return_value = np.array(
+        [[[1, 0], [0, 1]], [[0, 1], [0, 1]], [[0, 0], [0, 0]], [[1, 1], [1, 0]]]
+    )
+    embedding = CorrelationEmbedding(mock_patch)
+
+    # pixel (1, 1) is uncorrelated to the average of pixels (0, 0) and (0, 1).
+    assert select_uncorrelated_pixels(
+        mock_patch, embedding, {(3, 5), (3, 6)}, 0.1
+    ) == {(4, 6)}
+
+
 class TestEmbedding:
     @pytest.mark.filterwarnings("ignore::RuntimeWarning")
     def test_embedding_embedding(self, CE1, CE2, mock_patch):
@@ -84,7 +138,9 @@ class TestEmbedding:
                 0.96076892,
                 0.94491118,
             ],
+            rtol=1e-6,
         )
+        assert CE1.embedding.dtype == np.float32
 
         np.testing.assert_allclose(CE2.embedding[(0, 0, slice(None, None))], [0, 0, 0])
 
@@ -93,6 +149,108 @@ class TestEmbedding:
         np.testing.assert_allclose(CE1.get_vector((0,)), np.array([0.0, -2.0]))
 
 
+class TestIncrementalCorrelationEmbedding:
+    @pytest.fixture
+    def movie(self):
+        generator = np.random.RandomState(0)
+        return Movie("movie", generator.rand(50, 20, 20).astype(np.float32))
+
+    @pytest.mark.parametrize("seed", [(7, 9), (9, 5), (5, 7), (16, 16)])
+    def test_incremental_embedding_matches_full_embedding(self, movie, seed):
+        provider = IncrementalCorrelationEmbedding()
+        provider(Patch(movie, (7, 7), 7))
+
+        patch = Patch(movie, seed, 7)
+        embedding = provider(patch)
+        expected = CorrelationEmbedding(patch)
+
+        np.testing.assert_allclose(embedding.embedding, expected.embedding, atol=1e-6)
+        np.testing.assert_allclose(
+            embedding.normalized_data, expected.normalized_data, atol=1e-6
+        )
+        np.testing.assert_allclose(
+            embedding.get_vector((2, 3)), expected.embedding[:, 2, 3], atol=1e-6
+        )
+
+    def test_incremental_embedding_reuses_overlap(self, movie, mocker):
+        provider = IncrementalCorrelationEmbedding()
+        provider(Patch(movie, (7, 7), 7))
+        full_embedding = mocker.patch(
+            "hnccorr.graph.CorrelationEmbedding.__init__", return_value=None
+        )
+
+        embedding = provider(Patch(movie, (7, 8), 7))
+
+        full_embedding.assert_not_called()
+        assert embedding.embedding.shape == (49, 7, 7)
+
+    def test_incremental_embedding_does_not_keep_movie(self):
+        movie = Movie("movie", np.random.RandomState(0).rand(50, 20, 20))
+        provider = IncrementalCorrelationEmbedding()
+        provider(Patch(movie, (7, 7), 7))
+        reference = weakref.ref(movie)
+
+        del movie
+
+        other_movie = Movie("other", np.zeros((50, 20, 20)))
+        assert reference() is None
+        assert provider._overlap(Patch(other_movie, (7, 8), 7)) is None
+
+    def test_incremental_embedding_other_movie(self, movie):
+        provider = IncrementalCorrelationEmbedding()
+        provider(Patch(movie, (7, 7), 7))
+
+        other_movie = Movie("other", movie[:] + 1)
+        patch = Patch(other_movie, (7, 8), 7)
+        assert provider._overlap(patch) is None
+        np.testing.assert_allclose(
+            provider(patch).embedding,
+            CorrelationEmbedding(patch).embedding,
+            atol=1e-6,
+        )
+
+    def test_incremental_embedding_pickle(self, movie):
+        provider = IncrementalCorrelationEmbedding()
+        provider(Patch(movie, (7, 7), 7))
+
+        assert pickle.loads(pickle.dumps(provider))._last is None
+
+
+class TestLowRankCorrelationEmbedding:
+    @pytest.fixture
+    def patch(self, mock_patch):
+        generator = np.random.RandomState(1)
+        mock_patch.pixel_shape = (6, 5)
+        mock_patch.__getitem__.return_value = np.dot(
+            generator.rand(40, 3), generator.rand(3, 30)
+        ).reshape(40, 6, 5) + 0.001 * generator.rand(40, 6, 5)
+        return mock_patch
+
+    @staticmethod
+    def all_weights(embedding):
+        nodes1, nodes2 = np.triu_indices(30, 1)
+        return ExponentialDistanceDecay(2.0).compute_batch(embedding, nodes1, nodes2)
+
+    @pytest.mark.parametrize("rank", [6, 30, 100])
+    def test_weights_match_full_embedding(self, patch, rank):
+        low_rank = LowRankCorrelationEmbedding(patch, rank=rank)
+
+        assert low_rank.embedding.shape == (min(rank, 30), 6, 5)
+        assert low_rank.embedding.dtype == np.float32
+        np.testing.assert_allclose(
+            self.all_weights(low_rank),
+            self.all_weights(CorrelationEmbedding(patch)),
+            atol=1e-4,
+        )
+
+    def test_get_vector(self, patch):
+        low_rank = LowRankCorrelationEmbedding(patch, rank=4)
+
+        np.testing.assert_equal(
+            low_rank.get_vector((1, 2)), low_rank.embedding[:, 1, 2]
+        )
+
+
 def test_exponential_distance_decay():
     alpha = 0.5
 
@@ -101,47 +259,148 @@ def test_exponential_distance_decay():
     ) == pytest.approx(np.exp(-0.25))
 
 
+class TestExponentialDistanceDecay:
+    @pytest.fixture
+    def embedding(self, mock_embedding):
+        mock_embedding.embedding = np.random.RandomState(0).rand(6, 2, 3)
+        mock_embedding.get_vector = lambda x: mock_embedding.embedding[
+            (slice(None),) + x
+        ]
+        return mock_embedding
+
+    def test_exponential_distance_decay_pair(self):
+        assert ExponentialDistanceDecay(0.5)(
+            np.array([0.0, -2.0]), np.array([1.0, 0.0])
+        ) == pytest.approx(np.exp(-1.25))
+
+    @pytest.mark.parametrize("max_chunk_bytes", [2 ** 26, 1, 200])
+    def test_exponential_distance_decay_batch(self, embedding, max_chunk_bytes):
+        nodes1 = np.array([0, 0, 3, 5, 2])
+        nodes2 = np.array([1, 5, 4, 2, 2])
+        weight_function = ExponentialDistanceDecay(0.7, max_chunk_bytes)
+
+        expected = PairwiseWeightFunction(
+            lambda a, b: exponential_distance_decay(a, b, 0.7)
+        ).compute_batch(embedding, nodes1, nodes2)
+
+        np.testing.assert_allclose(
+            weight_function.compute_batch(embedding, nodes1, nodes2), expected
+        )
+        assert expected[-1] == pytest.approx(1.0)
+
+    def test_pairwise_weight_function(self, embedding):
+        weights = PairwiseWeightFunction(lambda a, b: a[0] + b[0]).compute_batch(
+            embedding, np.array([0, 4]), np.array([1, 1])
+        )
+        vectors = embedding.embedding.reshape(6, -1)
+        np.testing.assert_allclose(
+            weights, [vectors[0, 0] + vectors[0, 1], vectors[0, 4] + vectors[0, 1]]
+        )
+
+
+class TestSimilarityGraph:
+    @pytest.fixture
+    def graph(self):
+        return SimilarityGraph((3, 4), (5, 7), [0, 0, 11], [1, 5, 10], [0.5, 1.0, 0.2])
+
+    def test_similarity_graph_size(self, graph):
+        assert graph.num_nodes == 12
+        assert graph.num_edges == 3
+
+    def test_similarity_graph_degrees(self, graph):
+        expected = np.zeros(12)
+        expected[[0, 1, 5, 10, 11]] = [1.5, 0.5, 1.0, 0.2, 0.2]
+        np.testing.assert_allclose(graph.degrees(), expected)
+
+    def test_similarity_graph_to_movie_coordinates(self, graph):
+        assert graph.to_movie_coordinates([0, 5, 11]) == [(5, 7), (6, 8), (7, 10)]
+
+    def test_similarity_graph_to_node_indices(self, graph):
+        np.testing.assert_equal(
+            graph.to_node_indices([(5, 7), (6, 8), (7, 10), (4, 7), (5, 11)]),
+            [0, 5, 11],
+        )
+        assert len(graph.to_node_indices(set())) == 0
+
+
 class TestGraphConstructor:
     def test_graph_constructor(self, mock_patch, mock_edge_selector, mock_embedding):
-        mock_edge_selector.select_edges.return_value = [((0,), (1,)), ((0,), (2,))]
-        mock_patch.enumerate_pixels.return_value = [(i,) for i in range(7)]
-        mock_patch.to_movie_coordinate = lambda x: x
+        mock_edge_selector.select_edge_indices.return_value = (
+            np.array([0, 0], dtype=np.int32),
+            np.array([1, 2], dtype=np.int32),
+        )
+        mock_patch.pixel_shape = (7,)
+        mock_patch.coordinate_offset = (0,)
+        mock_embedding.embedding = np.zeros((7, 7))
         mock_embedding.get_vector = lambda x: x
 
         GC = GraphConstructor(mock_edge_selector, lambda a, b: b[0])
         G = GC.construct(mock_patch, mock_embedding)
 
-        num_nodes = 7
-        assert len(G.nodes) == num_nodes
-        for i in range(num_nodes):
-            assert (i,) in G.nodes
-
-        assert len(G.edges) == 4
-        assert ((0,), (1,)) in G.edges
-        assert ((0,), (2,)) in G.edges
-        assert ((2,), (0,)) in G.edges
-        assert ((1,), (0,)) in G.edges
-        assert G[(0,)][(1,)]["weight"] == 1
-        assert G[(0,)][(1,)]["weight"] == 1
-        assert G[(2,)][(0,)]["weight"] == 2
-        assert G[(2,)][(0,)]["weight"] == 2
+        assert G.num_nodes == 7
+        assert G.num_edges == 2
+        np.testing.assert_equal(G.heads, [0, 0])
+        np.testing.assert_equal(G.tails, [1, 2])
+        np.testing.assert_allclose(G.weights, [1, 2])
 
     def test_graph_constructor_nodes_offset_from_zero(
         self, mock_patch, mock_edge_selector, mock_embedding
     ):
-        all_pixels = {(2,), (3,), (4,), (5,), (6,), (7,), (8,)}
-        mock_patch.enumerate_pixels.return_value = all_pixels
-        mock_patch.to_movie_coordinate = lambda x: (2,) if x == (0,) else (3,)
+        mock_patch.pixel_shape = (7,)
+        mock_patch.coordinate_offset = (2,)
+        mock_embedding.embedding = np.zeros((7, 7))
         mock_embedding.get_vector = lambda x: x
 
-        mock_edge_selector.select_edges.return_value = [((0,), (1,))]
+        mock_edge_selector.select_edge_indices.return_value = ([0], [1])
 
         GC = GraphConstructor(mock_edge_selector, lambda x, y: 1)
         graph = GC.construct(mock_patch, mock_embedding)
 
-        assert set(graph.nodes) == all_pixels
-        assert graph[(2,)][(3,)]["weight"] == 1
-        assert graph[(3,)][(2,)]["weight"] == 1
+        assert graph.to_movie_coordinates(range(graph.num_nodes)) == [
+            (i,) for i in range(2, 9)
+        ]
+        assert graph.to_movie_coordinates([graph.heads[0], graph.tails[0]]) == [
+            (2,),
+            (3,),
+        ]
+        np.testing.assert_allclose(graph.weights, [1])
+
+    def test_graph_constructor_no_edges(
+        self, mock_patch, mock_edge_selector, mock_embedding
+    ):
+        mock_patch.pixel_shape = (3, 3)
+        mock_patch.coordinate_offset = (0, 0)
+        mock_embedding.embedding = np.zeros((9, 3, 3))
+        mock_edge_selector.select_edge_indices.return_value = (
+            np.array([], dtype=np.int32),
+            np.array([], dtype=np.int32),
+        )
+
+        graph = GraphConstructor(mock_edge_selector, lambda x, y: 1).construct(
+            mock_patch, mock_embedding
+        )
+
+        assert graph.num_nodes == 9
+        assert graph.num_edges == 0
+
+    @pytest.mark.parametrize("pairs", [[((0, 1), (2, 2)), ((1, 0), (0, 0))], set()])
+    def test_graph_constructor_edge_selector_with_pairs(
+        self, mock_patch, mock_embedding, pairs
+    ):
+        class PairEdgeSelector:
+            def select_edges(self, embedding):
+                return pairs
+
+        mock_patch.pixel_shape = (3, 3)
+        mock_patch.coordinate_offset = (0, 0)
+        mock_embedding.embedding = np.zeros((9, 3, 3))
+
+        graph = GraphConstructor(PairEdgeSelector(), lambda x, y: 1).construct(
+            mock_patch, mock_embedding
+        )
+
+        np.testing.assert_equal(graph.heads, [1, 3][: len(pairs)])
+        np.testing.assert_equal(graph.tails, [8, 0][: len(pairs)])
 
 
 class TestSparseComputationEmbeddingWrapper:
@@ -153,6 +412,22 @@ class TestSparseComputationEmbeddingWrapper:
             mock_embedding
         ) == {((0,), (1,)), ((3,), (4,))}
 
+    def test_sparse_computation_select_edge_indices(self, mock_embedding, mocker):
+        mock_embedding.embedding = np.zeros((2, 2, 3))
+        wrapper = SparseComputationEmbeddingWrapper(2, 0.2)
+        mocker.patch.object(
+            wrapper._sc,
+            "select_pairs",
+            return_value=[(4, 1), (0, 5), (1, 4), (2, 3), (0, 1)],
+        )
+
+        nodes1, nodes2 = wrapper.select_edge_indices(mock_embedding)
+
+        assert nodes1.dtype == np.int32
+        assert nodes2.dtype == np.int32
+        np.testing.assert_equal(nodes1, [0, 0, 1, 2])
+        np.testing.assert_equal(nodes2, [1, 5, 4, 3])
+
     def test_sparse_computation_with_dimension_reducer(self, mock_embedding):
         mock_embedding.embedding = np.array(
             [[-1, 0], [-0.9, 0], [0, 0], [0.9, 0], [1, 0]]
@@ -165,3 +440,17 @@ class TestSparseComputationEmbeddingWrapper:
         assert SparseComputationEmbeddingWrapper(
             2, 0.2, dimension_reducer=MockDimReducer()
         ).select_edges(mock_embedding) == {((0,), (1,)), ((3,), (4,))}
+
+    def test_sparse_computation_pickle(self, mock_embedding):
+        mock_embedding.embedding = np.array(
+            [[-1, 0], [-0.9, 0], [0, 0], [0.9, 0], [1, 0]]
+        ).T
+
+        wrapper = pickle.loads(pickle.dumps(SparseComputationEmbeddingWrapper(2, 0.2)))
+
+        assert wrapper.__getstate__() == {
+            "dim_low": 2,
+            "distance": 0.2,
+            "dimension_reducer": None,
+        }
+        assert wrapper.select_edges(mock_embedding) == {((0,), (1,)), ((3,), (4,))}
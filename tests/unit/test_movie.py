@@ -23,11 +23,13 @@
 # ENHANCEMENTS, OR MODIFICATIONS.
 import pytest
 import os
+import pickle
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy, deepcopy
 from pytest_mock import mocker
 
-from hnccorr.movie import Movie, Patch, Subsampler
+from hnccorr.movie import Movie, Patch, SharedMovie, Subsampler
 
 from conftest import TEST_DATA_DIR
 
@@ -142,6 +144,23 @@ class TestMovie:
         assert M[0, 0, 0] == 1.0
         np.testing.assert_allclose(M[2, :, :], movie_data[2, :, :])
 
+    def test_movie_fingerprint(self, M, movie_data):
+        assert M.fingerprint() == Movie("Copy", movie_data.copy()).fingerprint()
+        assert M.fingerprint() == M.fingerprint(chunk_size=2)
+
+        changed_data = movie_data.copy()
+        changed_data[2, 4, 9] = 0
+        assert M.fingerprint() != Movie("Changed", changed_data).fingerprint()
+        assert M.fingerprint() != Movie("Transposed", movie_data.T).fingerprint()
+
+    def test_movie_crop(self, M, movie_data):
+        cropped = M.crop((slice(1, 4), slice(2, 9)))
+
+        assert cropped.name == "Simple"
+        assert cropped.pixel_shape == (3, 7)
+        np.testing.assert_equal(cropped[:], movie_data[:, 1:4, 2:9])
+        assert M.crop((slice(0, 2), slice(0, 2)), name="Tile").name == "Tile"
+
     def test_movie_init_with_memmap(self, movie_data):
         # prepare memmapped file
         filename = os.path.join(TEST_DATA_DIR, "test_memdata.npy")
@@ -157,6 +176,44 @@ class TestMovie:
         np.testing.assert_allclose(movie[:], movie_data)
 
 
+def sum_patch(movie):
+    return Patch(movie, (2, 2), 3)[:].sum()
+
+
+class TestSharedMovie:
+    def test_shared_movie_data(self, M, movie_data):
+        with M.to_shared(chunk_size=2) as shared:
+            assert isinstance(shared, SharedMovie)
+            assert shared.name == "Simple"
+            assert shared.data_size == M.data_size
+            np.testing.assert_equal(shared[:], M[:])
+            assert shared.fingerprint() == M.fingerprint()
+
+    def test_shared_movie_pickle_shares_memory(self, M):
+        with M.to_shared() as shared:
+            handle = pickle.dumps(shared)
+            assert len(handle) < 1000
+
+            attached = pickle.loads(handle)
+            shared._data[1, 2, 3] = 7.0
+            assert attached[1, 2, 3] == 7.0
+            attached.close()
+
+    def test_shared_movie_in_worker_process(self, M):
+        with M.to_shared() as shared:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                assert executor.submit(sum_patch, shared).result() == sum_patch(M)
+
+    def test_shared_movie_close(self, M):
+        shared = M.to_shared()
+        handle = pickle.dumps(shared)
+        shared.close()
+        shared.close()
+
+        with pytest.raises(FileNotFoundError):
+            pickle.loads(handle)
+
+
 class TestPatch:
     def test_patch_pixel_shape(self, simple_patch):
         assert simple_patch.pixel_shape == (7,)
@@ -171,6 +228,12 @@ class TestPatch:
         with pytest.raises(ValueError):
             Patch(MM, (5,), 6)
 
+    @pytest.mark.parametrize(
+        "center_seed, offset", [((5,), (2,)), ((1,), (0,)), ((9,), (3,))]
+    )
+    def test_patch_compute_coordinate_offset(self, center_seed, offset):
+        assert Patch.compute_coordinate_offset(center_seed, 7, (10,)) == offset
+
     def test_patch_enumerate_pixels(self, simple_patch, MM2):
         assert simple_patch.enumerate_pixels() == {
             (3,),
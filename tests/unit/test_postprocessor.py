@@ -47,3 +47,11 @@ class TestSizePostprocessor:
             )
             is None
         )
+
+    def test_is_size_feasible(self, postprocessor):
+        assert postprocessor.is_size_feasible(3, 4)
+        assert postprocessor.is_size_feasible(1, 2)
+        assert postprocessor.is_size_feasible(5, 9)
+        assert postprocessor.is_size_feasible(0, 100)
+        assert not postprocessor.is_size_feasible(0, 1)
+        assert not postprocessor.is_size_feasible(6, 10)
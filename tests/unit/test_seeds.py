@@ -22,7 +22,9 @@
 # IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
 # ENHANCEMENTS, OR MODIFICATIONS.
 import pytest
+import numpy as np
 
+from hnccorr.movie import Movie
 from hnccorr.seeds import (
     PositiveSeedSelector,
     NegativeSeedSelector,
@@ -80,6 +82,16 @@ class TestLocalCorrelationSeeder:
         LCS.exclude_pixels({(6,)})
         assert LCS.next() is None
 
+    def test_seeder_exclude_pixels_padding_2d(self):
+        lcs = LocalCorrelationSeeder(3, 1.0, 1, 1)
+        lcs.select_seeds(Movie("Random", np.random.RandomState(0).rand(5, 6, 6)))
+        lcs.exclude_pixels({(0, 0), (3, 4)})
+
+        expected = np.zeros((6, 6), dtype=bool)
+        expected[0:2, 0:2] = True
+        expected[2:5, 3:6] = True
+        np.testing.assert_equal(lcs._excluded_pixels, expected)
+
     def test_seeder_reset_excluded_pixels(self, LCS, MM):
         LCS.select_seeds(MM)
         assert LCS.next() == (9,)
@@ -93,6 +105,85 @@ class TestLocalCorrelationSeeder:
         LCS.select_seeds(MM)
         assert LCS.next() == (9,)
 
+    def test_select_best_per_grid_block_2d(self):
+        lcs = LocalCorrelationSeeder(3, 1.0, 1, 2)
+        scores = np.arange(15, dtype=float).reshape(3, 5)
+        scores[2, 4] = np.nan
+
+        coordinates, values = lcs._select_best_per_grid_block(scores)
+
+        np.testing.assert_equal(
+            coordinates, [[1, 1], [1, 3], [1, 4], [2, 1], [2, 3], [2, 4]]
+        )
+        np.testing.assert_equal(values, [6, 8, 9, 11, 13, -np.inf])
+
+    @pytest.mark.parametrize(
+        "num_keep, expected",
+        [(0, []), (2, [2, 0]), (3, [2, 0, 3]), (5, [2, 0, 3, 1, 4])],
+    )
+    def test_select_top_indices_ties(self, num_keep, expected):
+        values = np.array([0.5, 0.1, 0.9, 0.5, 0.1])
+        np.testing.assert_equal(
+            LocalCorrelationSeeder._select_top_indices(values, num_keep), expected
+        )
+
+    def test_local_correlation_cache(self, tmpdir, mocker):
+        movie = Movie("Random", np.random.RandomState(0).rand(20, 6, 7))
+        lcs = LocalCorrelationSeeder(3, 0.5, 2, 2, cache_dir=str(tmpdir))
+        lcs.select_seeds(movie)
+        seeds = lcs._seeds
+
+        assert len(tmpdir.listdir()) == 1
+
+        cached_lcs = LocalCorrelationSeeder(3, 0.5, 2, 2, cache_dir=str(tmpdir))
+        compute = mocker.patch.object(cached_lcs, "_compute_local_correlation_image")
+        cached_lcs.select_seeds(movie)
+
+        compute.assert_not_called()
+        assert cached_lcs._seeds == seeds
+
+    def test_local_correlation_cache_neighborhood_size(self, tmpdir):
+        movie = Movie("Random", np.random.RandomState(0).rand(20, 6, 7))
+        LocalCorrelationSeeder(3, 0.5, 2, 2, cache_dir=str(tmpdir)).select_seeds(movie)
+        LocalCorrelationSeeder(5, 0.5, 2, 2, cache_dir=str(tmpdir)).select_seeds(movie)
+
+        assert len(tmpdir.listdir()) == 2
+
+    @pytest.mark.parametrize(
+        "neighborhood_size, chunk_size", [(3, 100), (5, 100), (3, 3), (5, 20)]
+    )
+    def test_local_correlation_image(self, neighborhood_size, chunk_size):
+        data = np.random.RandomState(0).rand(20, 6, 7) + 100
+        movie = Movie("Random", data)
+        lcs = LocalCorrelationSeeder(neighborhood_size, 1.0, 2, 1, chunk_size)
+        lcs._movie = movie
+
+        max_shift = (neighborhood_size - 1) // 2
+        expected = np.zeros(movie.pixel_shape)
+        for i, j in np.ndindex(*movie.pixel_shape):
+            neighbors = [
+                data[:, k, m]
+                for k in range(i - max_shift, i + max_shift + 1)
+                for m in range(j - max_shift, j + max_shift + 1)
+                if (k, m) != (i, j) and 0 <= k < 6 and 0 <= m < 7
+            ]
+            corr = np.corrcoef(np.array(neighbors), data[:, i, j].reshape(1, -1))
+            expected[i, j] = np.mean(corr[-1, :-1])
+
+        np.testing.assert_allclose(lcs._compute_local_correlation_image(), expected)
+
+    @pytest.mark.filterwarnings("ignore::RuntimeWarning")
+    def test_local_correlation_image_constant_pixel(self):
+        data = np.random.RandomState(0).rand(20, 4, 4)
+        data[:, 0, 0] = 1.0
+        lcs = LocalCorrelationSeeder(3, 1.0, 2, 1, 7)
+        lcs._movie = Movie("Constant pixel", data)
+
+        scores = lcs._compute_local_correlation_image()
+        assert np.isnan(scores[0, 0])
+        assert np.isnan(scores[1, 1])
+        assert not np.isnan(scores[3, 3])
+
 
 class TestPositiveSeedSelector:
     @pytest.mark.parametrize(
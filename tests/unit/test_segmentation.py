@@ -21,13 +21,24 @@
 # SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED "AS
 # IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
 # ENHANCEMENTS, OR MODIFICATIONS.
+import ctypes
 from copy import copy
 from itertools import product
+import pickle
 import pytest
 import networkx as nx
+import numpy as np
+from scipy.ndimage import binary_fill_holes
 
-
-from hnccorr.segmentation import HncParametricWrapper, Segmentation
+from closure.hnc import HNC as HNC_Closure
+from hnccorr.graph import SimilarityGraph
+from hnccorr.postprocessor import SizePostprocessor
+from hnccorr.segmentation import (
+    clean_segmentations,
+    HncArrayProblem,
+    HncParametricWrapper,
+    Segmentation,
+)
 
 
 class TestHNC:
@@ -56,6 +67,98 @@ class TestHNC:
         assert segmentations[0].selection == {(0,), (2,), (3,), (4,)}
         assert segmentations[0].weight == pytest.approx(2.0)
 
+    def test_hnc_similarity_graph(self):
+        G = SimilarityGraph((7,), (10,), [2], [0], [0.01])
+
+        h = HncParametricWrapper(0, 2)
+
+        segmentations = h.solve(G, {(12,), (13,), (14,)}, {(11,), (15,), (30,)})
+
+        assert len(segmentations) == 1
+        assert segmentations[0].selection == {(10,), (12,), (13,), (14,)}
+        assert segmentations[0].weight == pytest.approx(2.0)
+
+    def test_hnc_similarity_graph_parametric(self):
+        G = SimilarityGraph((4,), (0,), [0, 1, 2], [1, 2, 3], [1.0, 0.1, 1.0])
+
+        segmentations = HncParametricWrapper(0, 10).solve(G, {(0,)}, {(3,)})
+
+        assert [s.selection for s in segmentations] == [
+            {(0,), (1,)},
+            {(0,), (1,), (2,)},
+        ]
+        assert segmentations[0].weight == pytest.approx(0.9 / 2.2)
+        assert segmentations[1].weight == pytest.approx(10.0)
+
+
+class TestHncArrayProblem:
+    def test_hnc_array_problem_matches_closure(self):
+        rng = np.random.RandomState(0)
+        heads, tails = np.triu_indices(30, 1)
+        selected = rng.rand(len(heads)) < 0.2
+        heads, tails = heads[selected], tails[selected]
+        weights = rng.rand(len(heads))
+
+        G = nx.DiGraph()
+        G.add_nodes_from(range(30))
+        G.add_weighted_edges_from(zip(heads.tolist(), tails.tolist(), weights))
+        G.add_weighted_edges_from(zip(tails.tolist(), heads.tolist(), weights))
+        source_sets, breakpoints = HNC_Closure(G, {0, 1}, {28, 29}).solve_parametric(
+            0, 1
+        )
+
+        hnc = HncArrayProblem(30, heads, tails, weights, [0, 1], [28, 29])
+        array_source_sets, array_breakpoints = hnc.solve_parametric(0, 1)
+
+        assert [set(x.tolist()) for x in array_source_sets] == source_sets
+        assert array_breakpoints == pytest.approx(breakpoints)
+
+    def test_hnc_array_problem_library_signature(self):
+        with pytest.raises(ctypes.ArgumentError):
+            HncArrayProblem._library.hpf_solve(*([1.5] * 12))
+        with pytest.raises(TypeError):
+            HncArrayProblem._library.hpf_solve(1, 2)
+
+    def test_hnc_array_problem_solve(self):
+        hnc = HncArrayProblem(4, [0, 1, 2], [1, 2, 3], [1.0, 0.1, 1.0], [0], [3])
+
+        np.testing.assert_equal(hnc.solve(0.2), [0, 1])
+        np.testing.assert_equal(hnc.solve(0.5), [0, 1, 2])
+
+    def test_hnc_array_problem_contracts_seeds(self):
+        hnc = HncArrayProblem(
+            6,
+            [0, 1, 2, 3, 0],
+            [2, 2, 3, 4, 1],
+            [1.0, 0.5, 0.2, 1.0, 3.0],
+            [0, 1],
+            [4],
+        )
+
+        np.testing.assert_equal(hnc._nodes, [2, 3])
+        np.testing.assert_allclose(
+            hnc._arc_matrix,
+            [
+                [1, 2, 0.2, 0],
+                [2, 1, 0.2, 0],
+                [2, 3, 1.0, 0],
+                [0, 1, 1.5, 3.4],
+                [0, 2, 0.0, 2.4],
+            ],
+        )
+        assert [x.tolist() for x in hnc.solve_parametric(0, 1)[0]] == [
+            [0, 1, 2],
+            [0, 1, 2, 3],
+        ]
+
+    def test_hnc_array_problem_isolated_nodes_in_sink_set(self):
+        hnc = HncArrayProblem(5, [0], [1], [1.0], [2], [3])
+
+        source_sets, breakpoints = hnc.solve_parametric(0, 2)
+
+        assert [x.tolist() for x in source_sets] == [[2], [0, 1, 2]]
+        assert breakpoints[-1] == pytest.approx(2.0)
+
 
 class TestSegmentation:
     def test_segmentation_weight(self):
@@ -64,6 +167,55 @@ class TestSegmentation:
     def test_segmentation_selection(self):
         assert Segmentation({(0, 1)}, 0.5).selection == {(0, 1)}
 
+    def test_segmentation_from_mask(self):
+        mask = np.zeros((5, 6), dtype=bool)
+        mask[1, 2] = mask[3, 4] = True
+
+        segmentation = Segmentation.from_mask(mask, (10, 20), 0.5)
+
+        assert segmentation.selection == {(11, 22), (13, 24)}
+        assert segmentation.size == 2
+        assert segmentation.offset == (11, 22)
+        assert segmentation.mask.shape == (3, 3)
+        assert segmentation == Segmentation({(11, 22), (13, 24)}, 0.5)
+        np.testing.assert_equal(segmentation.coordinates(), [[11, 22], [13, 24]])
+
+    def test_segmentation_empty(self):
+        segmentation = Segmentation.from_mask(np.zeros((3, 3), dtype=bool), (1, 1), 1)
+
+        assert segmentation.size == 0
+        assert segmentation.selection == set()
+        assert segmentation == Segmentation(set(), 1)
+
+    def test_segmentation_equality(self):
+        assert Segmentation({(0, 1), (2, 2)}, 0.5) == Segmentation(
+            {(2, 2), (0, 1)}, 0.5
+        )
+        assert Segmentation({(0, 1)}, 0.5) != Segmentation({(0, 2)}, 0.5)
+        assert Segmentation({(0, 1)}, 0.5) != Segmentation({(0, 1), (0, 2)}, 0.5)
+        assert Segmentation({(0, 1)}, 0.5) != Segmentation({(0, 1)}, 0.6)
+
+    def test_segmentation_selection_setter(self):
+        segmentation = Segmentation({(0, 1)}, 0.5)
+        assert segmentation.selection == {(0, 1)}
+
+        segmentation.selection = [(4, 4), (5, 6)]
+        assert segmentation.size == 2
+        assert segmentation.selection == {(4, 4), (5, 6)}
+
+    def test_segmentation_intersection_size(self):
+        first = Segmentation({(0, 0), (1, 1), (2, 2), (3, 3)}, 0.5)
+
+        assert first.intersection_size(Segmentation({(1, 1), (3, 3), (3, 4)}, 0.5)) == 2
+        assert first.intersection_size(Segmentation({(4, 4)}, 0.5)) == 0
+        assert first.intersection_size(Segmentation(set(), 0.5)) == 0
+
+    def test_segmentation_pickle(self):
+        segmentation = Segmentation({(0, 1), (2, 2)}, 0.5)
+        segmentation.selection  # materialize cached set
+
+        assert pickle.loads(pickle.dumps(segmentation)) == segmentation
+
     def test_segmentation_equality_wrong_class(self):
         class FakeSegmentation:
             pass
@@ -90,3 +242,109 @@ class TestSegmentation:
         new = original.clean({(3, 3)}, (5, 5))
         assert new == Segmentation({(3, 3)}, weight)
         assert original == Segmentation(selection, weight)
+
+    def test_segmentation_fill_holes_open_to_movie_boundary(self):
+        # the gap at (0, 1) touches the movie boundary and is not a hole.
+        selection = {(0, 0), (1, 0), (1, 1), (1, 2), (0, 2)}
+
+        new = Segmentation(selection, 1).fill_holes((5, 5))
+
+        assert new == Segmentation(selection, 1)
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_segmentation_fill_holes_matches_full_movie(self, seed):
+        movie_pixel_shape = (12, 9)
+        mask = np.random.RandomState(seed).rand(*movie_pixel_shape) < 0.6
+        mask[:, :2] = False
+        selection = set(map(tuple, np.argwhere(mask).tolist()))
+
+        new = Segmentation(selection, 1).fill_holes(movie_pixel_shape)
+
+        expected = set(map(tuple, np.argwhere(binary_fill_holes(mask)).tolist()))
+        assert new.selection == expected
+
+    def test_segmentation_select_max_seed_component(self):
+        selection = {(0, 0), (0, 1), (1, 1), (3, 0), (3, 1), (3, 2), (1, 3)}
+        seeds = {(3, 1), (3, 2), (0, 0), (9, 9)}
+
+        new = Segmentation(selection, 1).select_max_seed_component(seeds)
+
+        assert new == Segmentation({(3, 0), (3, 1), (3, 2)}, 1)
+
+    def test_segmentation_select_max_seed_component_ties(self):
+        selection = {(5, 5), (5, 7), (6, 7)}
+
+        new = Segmentation(selection, 1).select_max_seed_component(set())
+
+        assert new == Segmentation({(5, 5)}, 1)
+
+
+class TestCleanSegmentations:
+    @pytest.mark.parametrize("seed", range(10))
+    def test_clean_segmentations_matches_clean(self, seed):
+        generator = np.random.RandomState(seed)
+        values = generator.rand(9, 11)
+        seeds = {(4, 5), (8, 1), (0, 0), (20, 20)}
+        segmentations = [
+            Segmentation.from_mask(values < threshold, (3, 4), threshold)
+            for threshold in (0.2, 0.4, 0.6, 0.9)
+        ]
+
+        assert clean_segmentations(segmentations, seeds, (30, 30)) == [
+            s.clean(seeds, (30, 30)) for s in segmentations
+        ]
+
+    def test_clean_segmentations_nested(self):
+        ring = {(1, 1), (1, 2), (1, 3), (2, 1), (2, 3), (3, 1), (3, 2), (3, 3)}
+        segmentations = [
+            Segmentation({(2, 2)}, 0.1),
+            Segmentation({(2, 2), (0, 0), (2, 3)}, 0.2),
+            Segmentation(ring | {(2, 2), (0, 0)}, 0.3),
+        ]
+
+        assert clean_segmentations(segmentations, {(2, 2)}, (5, 5)) == [
+            Segmentation({(2, 2)}, 0.1),
+            Segmentation({(2, 2), (2, 3)}, 0.2),
+            Segmentation(ring | {(2, 2)}, 0.3),
+        ]
+
+    def test_clean_segmentations_empty(self):
+        assert clean_segmentations([], {(1, 1)}, (5, 5)) == []
+        assert clean_segmentations(
+            [Segmentation(set(), 0.1), Segmentation({(1, 1)}, 0.2)], {(1, 1)}, (5, 5)
+        ) == [Segmentation(set(), 0.1), Segmentation({(1, 1)}, 0.2)]
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_clean_segmentations_size_feasible(self, seed):
+        generator = np.random.RandomState(seed)
+        values = generator.rand(9, 11)
+        seeds = {(4, 5), (8, 1)}
+        segmentations = [
+            Segmentation.from_mask(values < threshold, (3, 4), threshold)
+            for threshold in (0.05, 0.2, 0.4, 0.6, 0.9)
+        ]
+        postprocessor = SizePostprocessor(4, 30, 10)
+
+        cleaned = [s.clean(seeds, (30, 30)) for s in segmentations]
+        lazy_cleaned = clean_segmentations(
+            segmentations, seeds, (30, 30), postprocessor.is_size_feasible
+        )
+
+        assert all(s in cleaned for s in lazy_cleaned)
+        assert [s for s in cleaned if 4 <= s.size <= 30] == [
+            s for s in lazy_cleaned if 4 <= s.size <= 30
+        ]
+        assert postprocessor.select(lazy_cleaned) == postprocessor.select(cleaned)
+
+    def test_clean_segmentations_skips_infeasible(self):
+        segmentations = [
+            Segmentation({(2, 2)}, 0.1),
+            Segmentation({(2, 2), (2, 3), (3, 2), (3, 3), (0, 0)}, 0.2),
+            Segmentation({(i, j) for i in range(5) for j in range(5)}, 0.3),
+        ]
+
+        is_size_feasible = SizePostprocessor(3, 10, 5).is_size_feasible
+
+        assert clean_segmentations(
+            segmentations, {(2, 2)}, (5, 5), is_size_feasible
+        ) == [Segmentation({(2, 2), (2, 3), (3, 2), (3, 3)}, 0.2)]
@@ -0,0 +1,125 @@
+# Copyright © 2017. Regents of the University of California (Regents). All Rights
+# Reserved.
+#
+# Permission to use, copy, modify, and distribute this software and its documentation
+# for educational, research, and not-for-profit purposes, without fee and without a
+# signed licensing agreement, is hereby granted, provided that the above copyright
+# notice, this paragraph and the following two paragraphs appear in all copies,
+# modifications, and distributions. Contact The Office of Technology Licensing, UC
+# Berkeley, 2150 Shattuck Avenue, Suite 510, Berkeley, CA 94720-1620, (510) 643-7201,
+# for commercial licensing opportunities. Created by Quico Spaen, Roberto Asín-Achá,
+# and Dorit S. Hochbaum, Department of Industrial Engineering and Operations Research,
+# University of California, Berkeley.
+#
+# IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+# INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF THE USE
+# OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+# SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED "AS
+# IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+# ENHANCEMENTS, OR MODIFICATIONS.
+import pytest
+import numpy as np
+
+from hnccorr.movie import Movie
+from hnccorr.segmentation import Segmentation
+from hnccorr.tiling import Tile, TiledHNCcorr
+
+
+class FakeHNCcorr:
+    def __init__(self, patch_size, segmentations):
+        self.patch_size = patch_size
+        self._segmentations = segmentations
+        self.segmentations = []
+        self.movies = []
+
+    def segment(self, movie):
+        self.movies.append(movie)
+        self.segmentations = self._segmentations
+        return self
+
+
+@pytest.fixture
+def movie():
+    return Movie("Tiles", np.arange(2 * 10 * 7).reshape(2, 10, 7))
+
+
+class TestTile:
+    def test_tile_offset(self):
+        tile = Tile(0, (slice(4, 8), slice(0, 4)), (slice(1, 10), slice(0, 7)))
+        assert tile.offset == (1, 0)
+
+    def test_tile_owns(self):
+        tile = Tile(0, (slice(4, 8), slice(0, 4)), (slice(1, 10), slice(0, 7)))
+        assert tile.owns((4, 0))
+        assert tile.owns((7, 3))
+        assert not tile.owns((8, 3))
+        assert not tile.owns((5, 4))
+
+
+class TestTiledHNCcorr:
+    def test_tiles(self):
+        tiles = TiledHNCcorr(FakeHNCcorr(3, []), 4, halo=3).tiles((10, 7))
+
+        assert len(tiles) == 6
+        assert tiles[0] == Tile(
+            0, (slice(0, 4), slice(0, 4)), (slice(0, 7), slice(0, 7))
+        )
+        assert tiles[3] == Tile(
+            3, (slice(4, 8), slice(4, 7)), (slice(1, 10), slice(1, 7))
+        )
+        assert tiles[5] == Tile(
+            5, (slice(8, 10), slice(4, 7)), (slice(5, 10), slice(1, 7))
+        )
+
+        owners = np.zeros((10, 7), dtype=int)
+        for tile in tiles:
+            owners[tile.core] += 1
+        np.testing.assert_equal(owners, 1)
+
+    def test_halo_defaults_to_patch_size(self):
+        assert TiledHNCcorr(FakeHNCcorr(5, []), 4).halo == 5
+
+    def test_halo_smaller_than_patch_size(self):
+        with pytest.raises(ValueError):
+            TiledHNCcorr(FakeHNCcorr(5, []), 4, halo=4)
+
+    def test_segment_tile(self, movie):
+        hnccorr = FakeHNCcorr(
+            3,
+            [
+                Segmentation({(3, 0), (3, 1)}, 0.5),  # movie centroid (4, 0)
+                Segmentation({(0, 0), (1, 0)}, 0.7),  # movie centroid (1, 0)
+            ],
+        )
+        tiled = TiledHNCcorr(hnccorr, 4)
+        tile = tiled.tiles(movie.pixel_shape)[2]
+
+        segmentations = tiled.segment_tile(movie, tile)
+
+        assert tile.offset == (1, 0)
+        assert segmentations == [Segmentation({(4, 0), (4, 1)}, 0.5)]
+        np.testing.assert_equal(hnccorr.movies[0][:], movie[:, 1:10, 0:7])
+
+    def test_merge_removes_duplicates_of_other_tiles(self):
+        tiled = TiledHNCcorr(FakeHNCcorr(3, []), 4)
+        cell = Segmentation({(3, 3), (3, 4), (4, 3), (4, 4)}, 0.5)
+        duplicate = Segmentation({(3, 4), (4, 3), (4, 4), (4, 5)}, 0.5)
+        other = Segmentation({(4, 4), (4, 5), (5, 4), (5, 5)}, 0.5)
+
+        assert tiled.merge([[cell], [duplicate, other]]) == [cell, other]
+        assert tiled.merge([[cell, duplicate], [other]]) == [cell, duplicate, other]
+
+    def test_segment(self, movie):
+        cell = Segmentation({(1, 1), (2, 2)}, 0.5)
+        tiled = TiledHNCcorr(FakeHNCcorr(3, [cell]), 4).segment(movie)
+
+        # every tile finds the cell at a different location, and only the first tile
+        # owns its copy.
+        assert tiled.segmentations == [cell]
+        assert tiled.segmentations_to_list() == [
+            {"coordinates": list(tiled.segmentations[0].selection)}
+        ]
@@ -23,6 +23,8 @@
 # ENHANCEMENTS, OR MODIFICATIONS.
 import os
 
+import numpy as np
+
 from conftest import TEST_DATA_DIR
 
 from hnccorr.utils import (
@@ -33,6 +35,7 @@ from hnccorr.utils import (
     add_time_index,
     list_images,
     eight_neighborhood,
+    fixed_random_state,
 )
 
 
@@ -82,3 +85,16 @@ def test_four_neighborhood():
 
 def test_generate_pixles():
     assert set(generate_pixels((1, 2))) == {(0, 0), (0, 1)}
+
+
+def test_fixed_random_state():
+    np.random.seed(0)
+    with fixed_random_state([3, 5]):
+        first = np.random.rand()
+    outside = np.random.rand()
+    with fixed_random_state([3, 5]):
+        second = np.random.rand()
+
+    np.random.seed(0)
+    assert first == second
+    assert outside == np.random.rand()